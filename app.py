@@ -1,142 +1,912 @@
 #----------------------------------------------------------------------------#
 # Imports
 #----------------------------------------------------------------------------#
+import os
 import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import base64
+import hashlib
+import time
+import click
+from datetime import datetime, timedelta, timezone
+from functools import wraps, lru_cache, partial
+from contextlib import contextmanager
+from itertools import islice
+from bisect import bisect_left, insort
+from flask import Flask, Blueprint, current_app, g, render_template, request, Response, flash, redirect, url_for, abort, stream_with_context, session, make_response
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, DDL
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.http import is_resource_modified
+from werkzeug.local import LocalProxy
 import logging
 from logging import Formatter, FileHandler
-from flask_wtf import Form
-from forms import *
+from forms import VenueForm, ArtistForm, ShowForm
 from flask_migrate import Migrate
+from models import db, Area, Venue, Artist, Show, TableVersion
+from cache import make_cache
+from instrumentation import SQLInstrumentation
+from replicas import ReplicaSet, primary, read_only, reads_primary
+from importer import read_records, chunked, to_bool, validate, load_rows
+from exporter import FORMATS, export_lines
+from serialization import dumps
+import config
 import sys
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://dkhundley@localhost:5432/fyyur'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+# The application is built by create_app() (see Launch); the pages, API and commands below
+# are registered on it through this blueprint. Commands stay at the top level of 'flask'.
+bp = Blueprint('main', __name__, cli_group = None)
+moment = Moment()
+migrate = Migrate()
+# The cache create_app() built for the current application
+cache = LocalProxy(lambda: current_app.extensions['cache'])
 
 #----------------------------------------------------------------------------#
-# Models.
+# Filters.
 #----------------------------------------------------------------------------#
 
-class Venue(db.Model):
-    id = db.Column(db.Integer, primary_key = True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    address = db.Column(db.String(120))
-    phone = db.Column(db.String(120))
-    image_link = db.Column(db.String(500))
-    facebook_link = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String()))
-    website = db.Column(db.String(200))
-    seeking_talent = db.Column(db.Boolean)
-    seeking_description = db.Column(db.String(500))
-    shows = db.relationship('Show', backref = 'venue', lazy = True)
-
-    def __repr__(self):
-        return f'<Venue {self.id} {self.name}>'
-
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate
-
-class Artist(db.Model):
-    id = db.Column(db.Integer, primary_key = True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
-    image_link = db.Column(db.String(500))
-    facebook_link = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(120)))
-    website = db.Column(db.String(200))
-    seeking_venue = db.Column(db.Boolean)
-    seeking_description = db.Column(db.String(500))
-    shows = db.relationship('Show', backref = 'artist', lazy = True)
-
-    def __repr__(self):
-        return f'<Artist {self.id} {self.name}>'
-
-
-class Show(db.Model):
-    id = db.Column(db.Integer, primary_key = True)
-    artist_id = db.Column(db.Integer, db.ForeignKey('artist.id'), nullable = False)
-    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), nullable = False)
-    start_time = db.Column(db.DateTime, nullable = False)
-
-    def __repr__(self):
-        return f'<Show {self.id}>'
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+
+# babel and dateutil are imported on first use rather than with the app, which keeps them out
+# of every process start; the locale is parsed once rather than on every call
+
+@lru_cache(maxsize = None)
+def datetime_locale():
+  import babel
+  return babel.Locale.parse('en')
+
+@lru_cache(maxsize = None)
+def datetime_pattern(format):
+  import babel.dates
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+
+@lru_cache(maxsize = 16384)
+def format_datetime(value, format='medium'):
+  # Formats a datetime (or a string holding one) with a compiled babel pattern; results are
+  # memoised since many tiles share a start time and pages are rendered again and again
+  if isinstance(value, str):
+      value = parse_datetime(value)
+  # Naive datetimes are formatted as they are, as babel.dates.format_datetime would
+  if value.tzinfo is None:
+      value = value.replace(tzinfo = timezone.utc)
+  return datetime_pattern(format).apply(value, datetime_locale())
+
+def parse_datetime(value):
+  # Parses a date / time in any of the formats dateutil understands
+  import dateutil.parser
+  return dateutil.parser.parse(value)
+
+bp.add_app_template_filter(format_datetime, 'datetime')
 
 #----------------------------------------------------------------------------#
-# Filters.
+# Search.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale = 'en')
+# Postgres searches through the pg_trgm GIN indexes declared on the models.
+# SQLite has no trigram operators, so each searchable table gets an FTS5
+# trigram index kept in sync with its content table by triggers.
+SQLITE_SEARCH_DDL = [
+  "CREATE VIRTUAL TABLE {table}_search USING fts5(name, city, genres, content='{table}', content_rowid='id', tokenize='trigram')",
+  "CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO {table}_search(rowid, name, city, genres) VALUES (new.id, new.name, new.city, new.genres); END",
+  "CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} BEGIN "
+    "INSERT INTO {table}_search({table}_search, rowid, name, city, genres) VALUES ('delete', old.id, old.name, old.city, old.genres); END",
+  "CREATE TRIGGER {table}_search_update AFTER UPDATE OF name, city, genres ON {table} BEGIN "
+    "INSERT INTO {table}_search({table}_search, rowid, name, city, genres) VALUES ('delete', old.id, old.name, old.city, old.genres); "
+    "INSERT INTO {table}_search(rowid, name, city, genres) VALUES (new.id, new.name, new.city, new.genres); END"
+]
+
+for model in (Venue, Artist):
+    for statement in SQLITE_SEARCH_DDL:
+        event.listen(model.__table__, 'after_create', DDL(statement.format(table = model.__tablename__)).execute_if(dialect = 'sqlite'))
+    event.listen(model.__table__, 'before_drop', DDL(f'DROP TABLE IF EXISTS {model.__tablename__}_search').execute_if(dialect = 'sqlite'))
+
+# Genre spellings offered by the forms, keyed case-insensitively so that a search
+# term naming a genre can be matched against the GIN-indexed genres arrays
+GENRES = {genre.lower(): genre for genre, label in VenueForm.genres.kwargs['choices']}
+
+def search_query(model, search_term):
+  # Returns a query of (id, name) rows matching the search term over name, city and genres, best matches first
+  search_term = search_term.strip()
+  query = db.session.query(model.id, model.name)
+
+  if not search_term:
+      return query.order_by(model.name, model.id)
+
+  # Escaping LIKE wildcards so the term is always matched literally
+  pattern = '%{}%'.format(search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
+
+  # Trigram indexes cannot serve terms shorter than one trigram, so those fall back to a substring match
+  if len(search_term) < 3:
+      return query.filter(db.or_(model.name.ilike(pattern, escape = '\\'), model.city.ilike(pattern, escape = '\\'))) \
+        .order_by(model.name, model.id)
+
+  if db.engine.dialect.name == 'sqlite':
+      search_table = db.table(f'{model.__tablename__}_search', db.column('rowid'), db.column('rank'))
+      phrase = '"{}"'.format(search_term.replace('"', '""'))
+      return query.join(search_table, search_table.c.rowid == model.id) \
+        .filter(db.literal_column(search_table.name).op('MATCH')(phrase)) \
+        .order_by(search_table.c.rank, model.id)
+
+  # Postgres ranks ILIKE hits served by the trigram indexes by how closely the term matches a whole word
+  matches = [model.name.ilike(pattern, escape = '\\'), model.city.ilike(pattern, escape = '\\')]
+  relevance = db.func.greatest(db.func.word_similarity(search_term, model.name), db.func.word_similarity(search_term, model.city))
+  if search_term.lower() in GENRES:
+      matches.append(model.genres.contains([GENRES[search_term.lower()]]))
+  return query.filter(db.or_(*matches)).order_by(relevance.desc(), model.name, model.id)
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+def count_shows(model, *criteria):
+  # Counts each venue's / artist's shows matching the criteria in SQL, correlated to the
+  # enclosing statement so it is answered per row from the (id, start_time) indexes
+  foreign_key = {Venue: Show.venue_id, Artist: Show.artist_id}[model]
+  return db.select(db.func.count(Show.id)) \
+    .where(foreign_key == model.id, *criteria) \
+    .correlate(model) \
+    .scalar_subquery()
+
+def venue_shows(venue_id):
+  # Every show at the venue in start time order, with its artist joined into the same statement
+  return db.select(Show).options(db.joinedload(Show.artist, innerjoin = True)) \
+    .where(Show.venue_id == venue_id) \
+    .order_by(Show.start_time, Show.id)
+
+def artist_shows(artist_id):
+  # Every show by the artist in start time order, with its venue joined into the same statement
+  return db.select(Show).options(db.joinedload(Show.venue, innerjoin = True)) \
+    .where(Show.artist_id == artist_id) \
+    .order_by(Show.start_time, Show.id)
+
+def genre_table(model):
+  # The genres of the enclosing statement's venue / artist as a table of one value column:
+  # json_each() on SQLite, unnest() on Postgres
+  if db.engine.dialect.name == 'sqlite':
+      return db.func.json_each(model.genres).table_valued('value')
+  return db.func.unnest(model.genres).table_valued('value').render_derived()
+
+def has_genre(model, genre):
+  # Whether a venue's / artist's genres include genre: answered from the GIN index on Postgres,
+  # by expanding the JSON array on SQLite
+  if db.engine.dialect.name == 'sqlite':
+      genres = genre_table(model)
+      return db.select(genres.c.value).where(genres.c.value == genre).exists()
+  return model.genres.contains([genre])
+
+def canonical_genre(genre):
+  # A requested genre in the spelling the forms store, or None when blank
+  genre = (genre or '').strip()
+  return GENRES.get(genre.lower(), genre) or None
+
+def genre_counts(model, area_id = None):
+  # How many venues / artists, all or those of an area, list each genre, most common first,
+  # in one grouped scan
+  genres, count = genre_table(model), db.func.count()
+  statement = db.select(genres.c.value, count).select_from(model).join(genres, db.true()) \
+    .group_by(genres.c.value) \
+    .order_by(count.desc(), genres.c.value)
+  if area_id is not None:
+      statement = statement.where(model.area_id == area_id)
+  return statement
+
+def genre_facets(model, area_id = None):
+  # genre_counts() through the cache, for FACET_CACHE_TTL seconds, since it reads every row counted
+  key = f'genres:{model.__tablename__}:{area_id or ""}'
+  facets = cache.get(key)
+  if facets is None:
+      facets = [{'genre': genre, 'count': count} for genre, count in db.session.execute(genre_counts(model, area_id))]
+      cache.set(key, facets, current_app.config['FACET_CACHE_TTL'])
+  return facets
+
+def venue_free(start, end):
+  # Whether the venue of the enclosing statement has no show overlapping [start, end). On
+  # Postgres an anti-join probing the GiST index of the venue booking constraint; elsewhere
+  # the latest show starting before end, found in the (venue_id, start_time) index, must end
+  # by start (see booking_conflicts)
+  if db.engine.dialect.name == 'postgresql':
+      booked = db.func.tsrange(Show.start_time, Show.end_time).op('&&')(db.func.tsrange(start, end))
+      return ~db.select(Show.id).where(Show.venue_id == Venue.id, booked).correlate(Venue).exists()
+  latest_end = db.select(Show.end_time) \
+    .where(Show.venue_id == Venue.id, Show.start_time < end) \
+    .order_by(Show.start_time.desc()) \
+    .limit(1) \
+    .correlate(Venue) \
+    .scalar_subquery()
+  return db.func.coalesce(latest_end, start) <= start
+
+def venue_listing():
+  # The columns of a /venues tile, with the venue's maintained upcoming show count
+  return db.select(Venue.id, Venue.name, Venue.city, Venue.state, Venue.upcoming_shows_count.label('num_upcoming_shows'))
+
+def artist_listing(genre = None):
+  # The columns of an /artists tile, with the artist's maintained upcoming show count, for the
+  # artists listing genre if given
+  statement = db.select(Artist.id, Artist.name, Artist.upcoming_shows_count.label('num_upcoming_shows'))
+  return statement.where(has_genre(Artist, genre)) if genre is not None else statement
+
+def show_listing():
+  # The columns of a /shows tile, with the artist and venue joined into the same statement
+  return db.select(
+      Show.id,
+      Show.venue_id,
+      Venue.name.label('venue_name'),
+      Show.artist_id,
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link'),
+      Show.start_time,
+      Show.end_time
+    ).select_from(Show).join(Artist).join(Venue)
+
+def export_statement(entity, start = None, end = None, venue_id = None, artist_id = None):
+  # Selects the rows of an export in primary key order, which streams straight off the
+  # primary key index. The filters apply to shows; venues and artists are narrowed to
+  # those with at least one matching show.
+  criteria = []
+  if start is not None:
+      criteria.append(Show.start_time >= start)
+  if end is not None:
+      criteria.append(Show.start_time < end)
+  if venue_id is not None:
+      criteria.append(Show.venue_id == venue_id)
+  if artist_id is not None:
+      criteria.append(Show.artist_id == artist_id)
+
+  if entity == 'shows':
+      return db.select(Show.id, Show.venue_id, Venue.name.label('venue'), Show.artist_id, Artist.name.label('artist'), Show.start_time, Show.end_time) \
+        .select_from(Show).join(Venue).join(Artist) \
+        .where(*criteria) \
+        .order_by(Show.id)
+
+  model, foreign_key = {'venues': (Venue, Show.venue_id), 'artists': (Artist, Show.artist_id)}[entity]
+  statement = db.select(*model.__table__.columns).order_by(model.id)
+  if criteria:
+      statement = statement.where(model.id.in_(db.select(foreign_key).where(*criteria)))
+  return statement
+
+def stream_export(entity, **filters):
+  # Executes an export so rows are fetched EXPORT_BATCH_SIZE at a time, through a
+  # server-side cursor on Postgres
+  statement = export_statement(entity, **filters).execution_options(yield_per = current_app.config['EXPORT_BATCH_SIZE'])
+  return db.session.execute(statement)
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue and Artist carry upcoming_shows_count / past_shows_count so listings and
+# searches read a column instead of counting shows. ORM writes to Show adjust
+# them as they happen; shows passing from upcoming to past are rolled forward
+# by 'flask counters roll', and 'flask counters rebuild' recounts everything.
+
+def adjust_show_counts(connection, venue_id, artist_id, start_time, delta):
+  # Adds delta to the upcoming or past counter of the show's venue and artist
+  column = 'upcoming_shows_count' if start_time > datetime.now() else 'past_shows_count'
+  for model, entity_id in ((Venue, venue_id), (Artist, artist_id)):
+      table = model.__table__
+      connection.execute(db.update(table).where(table.c.id == entity_id).values({column: table.c[column] + delta}))
+
+@event.listens_for(Show, 'after_insert')
+def count_inserted_show(mapper, connection, show):
+  adjust_show_counts(connection, show.venue_id, show.artist_id, show.start_time, 1)
+
+@event.listens_for(Show, 'after_delete')
+def count_deleted_show(mapper, connection, show):
+  adjust_show_counts(connection, show.venue_id, show.artist_id, show.start_time, -1)
+
+@event.listens_for(Show, 'after_update')
+def count_updated_show(mapper, connection, show):
+  # Moving the show's contribution only when its venue, artist or start time changed
+  state = db.inspect(show)
+  previous = {}
+  for attribute in ('venue_id', 'artist_id', 'start_time'):
+      history = state.attrs[attribute].history
+      previous[attribute] = history.deleted[0] if history.deleted else getattr(show, attribute)
+  if previous != {attribute: getattr(show, attribute) for attribute in previous}:
+      adjust_show_counts(connection, previous['venue_id'], previous['artist_id'], previous['start_time'], -1)
+      adjust_show_counts(connection, show.venue_id, show.artist_id, show.start_time, 1)
+
+def refresh_show_counts(model, now, ids = None):
+  # Recounts the counters of the given venues / artists (all of them by default) in one UPDATE
+  statement = db.update(model).values(
+    upcoming_shows_count = count_shows(model, Show.start_time > now),
+    past_shows_count = count_shows(model, Show.start_time <= now)
+  )
+  if ids is not None:
+      statement = statement.where(model.id.in_(ids))
+  return db.session.execute(statement.execution_options(synchronize_session = False)).rowcount
+
+#----------------------------------------------------------------------------#
+# Areas.
+#----------------------------------------------------------------------------#
+
+# Venues and artists keep the city / state they were entered with, and point at
+# the Area row for that pair, created on first use. Areas carry venue_count /
+# artist_count, adjusted by ORM writes like the show counters; bulk loads call
+# refresh_area_counts() instead.
+
+def area_key(city, state):
+  # The normalised (city, state) of an area; None when either is missing
+  city, state = (city or '').strip(), (state or '').strip().upper()
+  return (city, state) if city and state else None
+
+def area_ids(connection, keys):
+  # Maps (city, state) keys onto area ids, inserting the areas that do not exist yet
+  keys = {key for key in keys if key is not None}
+  if not keys:
+      return {}
+  insert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}[connection.dialect.name](Area.__table__)
+  connection.execute(
+    insert.values([{'city': city, 'state': state} for city, state in keys])
+      .on_conflict_do_nothing(index_elements = ['state', 'city'])
+  )
+  cities = {city for city, state in keys}
+  areas = connection.execute(db.select(Area.id, Area.city, Area.state).where(Area.city.in_(cities)))
+  return {(city, state): area_id for area_id, city, state in areas if (city, state) in keys}
+
+def adjust_area_count(connection, model, area_id, delta):
+  if area_id is not None:
+      column = {Venue: 'venue_count', Artist: 'artist_count'}[model]
+      connection.execute(db.update(Area.__table__).where(Area.__table__.c.id == area_id).values({column: Area.__table__.c[column] + delta}))
+
+def refresh_area_counts(ids = None):
+  # Recounts the venues and artists of the given areas (all of them by default) in one UPDATE
+  statement = db.update(Area).values(
+    venue_count = db.select(db.func.count(Venue.id)).where(Venue.area_id == Area.id).correlate(Area).scalar_subquery(),
+    artist_count = db.select(db.func.count(Artist.id)).where(Artist.area_id == Area.id).correlate(Area).scalar_subquery()
+  )
+  if ids is not None:
+      statement = statement.where(Area.id.in_(ids))
+  return db.session.execute(statement.execution_options(synchronize_session = False)).rowcount
+
+def assign_area(mapper, connection, target):
+  # Pointing a venue / artist at the area of its city and state when either changed
+  state = db.inspect(target)
+  if state.attrs.city.history.has_changes() or state.attrs.state.history.has_changes() or target.area_id is None:
+      key = area_key(target.city, target.state)
+      target.area_id = area_ids(connection, [key]).get(key)
+
+def count_inserted(mapper, connection, target):
+  adjust_area_count(connection, mapper.class_, target.area_id, 1)
+
+def count_deleted(mapper, connection, target):
+  adjust_area_count(connection, mapper.class_, target.area_id, -1)
+
+def count_moved(mapper, connection, target):
+  history = db.inspect(target).attrs.area_id.history
+  if history.deleted and history.deleted[0] != target.area_id:
+      adjust_area_count(connection, mapper.class_, history.deleted[0], -1)
+      adjust_area_count(connection, mapper.class_, target.area_id, 1)
+
+for model in (Venue, Artist):
+    event.listen(model, 'before_insert', assign_area)
+    event.listen(model, 'before_update', assign_area)
+    event.listen(model, 'after_insert', count_inserted)
+    event.listen(model, 'after_delete', count_deleted)
+    event.listen(model, 'after_update', count_moved)
+
+#----------------------------------------------------------------------------#
+# Bookings.
+#----------------------------------------------------------------------------#
+
+# A show books its venue and its artist for [start_time, end_time). Postgres
+# rejects overlapping bookings through the exclusion constraints on Show; the
+# checks below find the conflicts first so they can be reported (and are the
+# only guard on SQLite). Since the bookings of one venue or artist never
+# overlap, the only one that can overlap a new booking is the latest starting
+# before it ends, so each check is one descent of the (venue_id / artist_id,
+# start_time) index however long the history grows.
+
+def show_end_time(start_time, end_time = None):
+  # The end of a show, SHOW_DEFAULT_DURATION minutes after its start unless given
+  return end_time or start_time + timedelta(minutes = current_app.config['SHOW_DEFAULT_DURATION'])
+
+# SQLSTATE of an exclusion constraint violation: a booking overlapping one committed meanwhile
+EXCLUSION_VIOLATION = '23P01'
+
+def booking_race(error):
+  # Whether an IntegrityError comes from the exclusion constraints rather than, say, a foreign
+  # key; psycopg 3 reports the SQLSTATE as sqlstate, psycopg2 as pgcode
+  return (getattr(error.orig, 'sqlstate', None) or getattr(error.orig, 'pgcode', None)) == EXCLUSION_VIOLATION
+
+def describe_booking(kind, show):
+  return f'the {kind} is booked for show {show.id} ({show.start_time:%Y-%m-%d %H:%M} to {show.end_time:%Y-%m-%d %H:%M})'
+
+def booking_conflicts(candidates, batch_size = 1000):
+  # For each (venue_id, artist_id, start_time, end_time) candidate, descriptions of the existing
+  # shows of its venue and artist it overlaps. The candidates are sent as a VALUES list, so a
+  # batch is checked in a single statement whatever its length.
+  conflicts = [[] for candidate in candidates]
+  for offset in range(0, len(candidates), batch_size):
+      candidate = db.values(
+          db.column('n', db.Integer), db.column('venue_id', db.Integer), db.column('artist_id', db.Integer),
+          db.column('start_time', db.DateTime), db.column('end_time', db.DateTime),
+          name = 'candidate'
+        ).data([(n, *values) for n, values in enumerate(candidates[offset:offset + batch_size], offset)]).cte()
+
+      # Finding the latest show of each candidate's venue and artist starting before it ends...
+      latest = {
+        kind: db.select(Show.id)
+          .where(getattr(Show, f'{kind}_id') == candidate.c[f'{kind}_id'], Show.start_time < candidate.c.end_time)
+          .order_by(Show.start_time.desc())
+          .limit(1)
+          .correlate(candidate)
+          .scalar_subquery()
+          .label(f'{kind}_show_id')
+        for kind in ('venue', 'artist')
+      }
+      probe = db.select(candidate.c.n, candidate.c.start_time, *latest.values()).subquery()
+
+      # ... and keeping those still running when it starts
+      venue_show, artist_show = db.aliased(Show), db.aliased(Show)
+      statement = db.select(probe.c.n, venue_show, artist_show).select_from(probe) \
+        .outerjoin(venue_show, db.and_(venue_show.id == probe.c.venue_show_id, venue_show.end_time > probe.c.start_time)) \
+        .outerjoin(artist_show, db.and_(artist_show.id == probe.c.artist_show_id, artist_show.end_time > probe.c.start_time)) \
+        .where(db.or_(venue_show.id.is_not(None), artist_show.id.is_not(None)))
+      for n, *shows in db.session.execute(statement):
+          conflicts[n] = [describe_booking(kind, show) for kind, show in zip(('venue', 'artist'), shows) if show is not None]
+  return conflicts
+
+def calendar_overlaps(calendar, start_time, end_time):
+  # The same check against an in-memory calendar: a sorted list of non-overlapping (start, end) pairs
+  position = bisect_left(calendar, (end_time,))
+  return position > 0 and calendar[position - 1][1] > start_time
+
+def resolve_references(model, references):
+  # Maps the ids and exact names a chunk of shows refers to onto existing venue / artist ids;
+  # names shared by several entities are left unresolved
+  ids = {reference for reference in references if isinstance(reference, int)}
+  names = {reference for reference in references if isinstance(reference, str)}
+  resolved, duplicates = {}, set()
+  for entity_id, name in db.session.query(model.id, model.name).filter(db.or_(model.id.in_(ids), model.name.in_(names))):
+      if entity_id in ids:
+          resolved[entity_id] = entity_id
+      if name in names:
+          if name in resolved:
+              duplicates.add(name)
+          resolved[name] = entity_id
+  for name in duplicates:
+      del resolved[name]
+  return resolved
+
+def show_reference(record, key):
+  # A show record names its venue / artist by <key>_id or, failing that, by exact <key> name
+  entity_id = str(record.get(f'{key}_id') or '').strip()
+  if entity_id:
+      return int(entity_id) if entity_id.isdigit() else entity_id
+  return str(record.get(key) or '').strip() or None
+
+def prepare_shows(form, chunk, touched):
+  # Validates show records with ShowForm, resolves their venue and artist in two queries per
+  # chunk and rejects shows double-booking their venue or artist, checked against the database
+  # in one more query per chunk and against the shows accepted earlier in the chunk
+  valid, rejects = [], []
+  for line_number, record in chunk:
+      data, errors = validate(form, record)
+      venue, artist = show_reference(record, 'venue'), show_reference(record, 'artist')
+      errors = dict(errors, **{key: ['This field is required.'] for key, reference in (('venue', venue), ('artist', artist)) if reference is None})
+      if errors:
+          rejects.append((line_number, errors))
+      elif data['end_time'] is not None and data['end_time'] <= data['start_time']:
+          rejects.append((line_number, {'end_time': ['A show must end after it starts']}))
+      else:
+          valid.append((line_number, venue, artist, data['start_time'], show_end_time(data['start_time'], data['end_time'])))
+
+  venues = resolve_references(Venue, {venue for line_number, venue, artist, start_time, end_time in valid})
+  artists = resolve_references(Artist, {artist for line_number, venue, artist, start_time, end_time in valid})
+
+  resolved = []
+  for line_number, venue, artist, start_time, end_time in valid:
+      errors = {}
+      if venue not in venues:
+          errors['venue'] = [f'No single venue matches {venue!r}']
+      if artist not in artists:
+          errors['artist'] = [f'No single artist matches {artist!r}']
+      if errors:
+          rejects.append((line_number, errors))
+      else:
+          resolved.append((line_number, venues[venue], artists[artist], start_time, end_time))
+
+  rows = []
+  bookings = {}
+  conflicts = booking_conflicts([candidate[1:] for candidate in resolved])
+  for (line_number, venue_id, artist_id, start_time, end_time), booked in zip(resolved, conflicts):
+      calendars = {kind: bookings.setdefault((kind, entity_id), []) for kind, entity_id in (('venue', venue_id), ('artist', artist_id))}
+      booked += [f'the {kind} is booked by an earlier show of this batch'
+                 for kind, calendar in calendars.items() if calendar_overlaps(calendar, start_time, end_time)]
+      if booked:
+          rejects.append((line_number, {'start_time': booked}))
+          continue
+      for calendar in calendars.values():
+          insort(calendar, (start_time, end_time))
+      rows.append({'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start_time, 'end_time': end_time})
+      touched[Venue].add(venue_id)
+      touched[Artist].add(artist_id)
+  return rows, rejects
+
+def expand_shows(entries, limit):
+  # Numbers the shows of a scheduling request as (entry, occurrence) positions. An entry with
+  # an 'rrule' (an RFC 5545 recurrence rule such as 'FREQ=WEEKLY;COUNT=52') repeats from its
+  # start_time, each occurrence keeping its duration. Times may be given in any ISO 8601 form.
+  from dateutil.rrule import rrulestr
+  records, rejects = [], []
+  for index, entry in enumerate(entries):
+      if not isinstance(entry, dict):
+          rejects.append(((index, 0), {'show': ['Expected an object']}))
+          continue
+      entry = dict(entry)
+
+      # Rejecting unparseable times here, as the form's DataRequired would report them as missing
+      errors = {}
+      for key in ('start_time', 'end_time'):
+          if entry.get(key):
+              try:
+                  entry[key] = parse_datetime(str(entry[key]))
+              except (ValueError, OverflowError):
+                  errors[key] = ['Not a valid datetime value.']
+      # A recurrence repeats from its start time, which the form would only check afterwards
+      if entry.get('rrule') and not entry.get('start_time'):
+          errors['start_time'] = ['This field is required.']
+      if errors:
+          rejects.append(((index, 0), errors))
+          continue
+      if not entry.get('rrule'):
+          records.append(((index, 0), entry))
+          continue
+      duration = entry['end_time'] - entry['start_time'] if entry.get('end_time') else None
+      try:
+          occurrences = rrulestr(str(entry.pop('rrule')), dtstart = entry['start_time'])
+          repeats = [((index, occurrence), dict(entry, start_time = start_time, end_time = duration and start_time + duration))
+                     for occurrence, start_time in enumerate(islice(occurrences, limit + 1))]
+      except (ValueError, OverflowError):
+          rejects.append(((index, 0), {'rrule': ['Not a valid recurrence rule, e.g. FREQ=WEEKLY;COUNT=52']}))
+          continue
+      records += repeats
+      if len(records) > limit:
+          break
+  if len(records) > limit:
+      raise ValueError(f'At most {limit} shows can be scheduled at once')
+  return records, rejects
+
+def schedule_shows(entries, skip_rejected = False):
+  # Books a batch of shows (see expand_shows) in one transaction: a fixed number of statements
+  # validate, resolve and check them and a single multi-row INSERT adds them. Returns the new
+  # show ids and the rejected positions with their errors; when a show is rejected nothing is
+  # inserted, unless skip_rejected.
+  form = ShowForm(formdata = None, meta = {'csrf': False})
+  records, rejects = expand_shows(entries, current_app.config['MAX_BULK_SHOWS'])
+  touched = {Venue: set(), Artist: set()}
+  rows, invalid = prepare_shows(form, records, touched)
+  rejects = sorted(rejects + invalid, key = lambda reject: reject[0])
+  if not rows or (rejects and not skip_rejected):
+      return [], rejects
+
+  with unit_of_work():
+      ids = db.session.scalars(Show.__table__.insert().values(rows).returning(Show.__table__.c.id)).all()
+      # A multi-row INSERT bypasses the ORM events that keep the counters current
+      now = datetime.now()
+      refresh_show_counts(Venue, now, touched[Venue])
+      refresh_show_counts(Artist, now, touched[Artist])
+  cache.delete(*[f'venue:{venue_id}' for venue_id in touched[Venue]], *[f'artist:{artist_id}' for artist_id in touched[Artist]])
+  return ids, rejects
+
+#----------------------------------------------------------------------------#
+# Pagination.
+#----------------------------------------------------------------------------#
+
+def encode_cursor(row, order_by):
+  # Packs a row's ordering key into an opaque, URL-safe cursor
+  values = [row._mapping[column] for column in order_by]
+  payload = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+  return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(cursor, order_by):
+  # Unpacks a cursor into typed SQL literals comparable with the ordering key
+  if not cursor:
+      return None
+  try:
+      values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+      if not isinstance(values, list) or len(values) != len(order_by):
+          abort(400)
+      values = [datetime.fromisoformat(value) if isinstance(column.type, db.DateTime) else value for column, value in zip(order_by, values)]
+  except (ValueError, TypeError):
+      abort(400)
+  return db.tuple_(*[db.literal(value, column.type) for column, value in zip(order_by, values)])
+
+def keyset_page(statement, order_by, args):
+  # Narrows a select() to the page following ?after= (or preceding ?before=), seeking on the
+  # order_by key so deep pages cost the same as the first. Returns the statement with a function
+  # turning its rows into the page's rows and the cursors of the neighbouring pages.
+  limit = min(max(args.get('limit', current_app.config['PAGE_SIZE'], type = int), 1), current_app.config['MAX_PAGE_SIZE'])
+  after = decode_cursor(args.get('after'), order_by)
+  before = decode_cursor(args.get('before'), order_by)
+  key = db.tuple_(*order_by)
+
+  # One row past the limit is fetched to tell whether there is a further page
+  if before is not None:
+      # Walking backwards from the cursor; keyset_rows restores the natural order
+      statement = statement.where(key < before).order_by(*[column.desc() for column in order_by])
+  else:
+      if after is not None:
+          statement = statement.where(key > after)
+      statement = statement.order_by(*order_by)
+  return statement.limit(limit + 1), partial(keyset_rows, order_by = order_by, limit = limit, after = after, before = before)
+
+def keyset_rows(rows, order_by, limit, after, before):
+  has_more = len(rows) > limit
+  if before is not None:
+      rows = rows[:limit][::-1]
+      prev_cursor = encode_cursor(rows[0], order_by) if has_more else None
+      next_cursor = encode_cursor(rows[-1], order_by) if rows else None
+  else:
+      rows = rows[:limit]
+      prev_cursor = encode_cursor(rows[0], order_by) if after is not None and rows else None
+      next_cursor = encode_cursor(rows[-1], order_by) if has_more else None
+  return rows, {'prev': prev_cursor, 'next': next_cursor, 'limit': limit}
+
+def keyset_paginate(statement, order_by):
+  # Returns one page of rows for the current request plus the cursors of the neighbouring pages
+  statement, page_rows = keyset_page(statement, order_by, request.args)
+  return page_rows(db.session.execute(statement).all())
+
+#----------------------------------------------------------------------------#
+# Caching.
+#----------------------------------------------------------------------------#
+
+def page_ttl(upcoming_shows, now):
+  # A detail page goes stale either after the default TTL or once its next upcoming show
+  # starts (and moves to the past shows), whichever comes first
+  ttl = current_app.config['CACHE_DEFAULT_TTL']
+  if upcoming_shows:
+      ttl = min(ttl, max((upcoming_shows[0]['start_time'] - now).total_seconds(), 0))
+  return ttl
+
+def invalidate_venue(venue_id):
+  # Drops the venue's page and the pages of every artist listing a show there
+  artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()
+  cache.delete(f'venue:{venue_id}', *[f'artist:{artist_id}' for artist_id, in artist_ids])
+
+def invalidate_artist(artist_id):
+  # Drops the artist's page and the pages of every venue listing one of their shows
+  venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()
+  cache.delete(f'artist:{artist_id}', *[f'venue:{venue_id}' for venue_id, in venue_ids])
+
+def cached_page_data(kind, entity_id, version = None):
+  # Reads a venue / artist page's data through the cache, assembling it on a miss. Entries
+  # carry the version (the page's ETag) they were assembled under, and one assembled under
+  # another version than the requested one counts as a miss: a worker whose cache outlived an
+  # edit made through another worker can then never serve its stale body under the new ETag
+  key = f'{kind}:{entity_id}'
+  entry = cache.get(key)
+  if entry is None or version is not None and entry[0] != version:
+      # Assembled from the primary, so replication lag is never cached for a whole TTL
+      with primary():
+          data, ttl = {'venue': venue_page_data, 'artist': artist_page_data}[kind](entity_id)
+      entry = (version, data)
+      cache.set(key, entry, ttl)
+  return entry[1]
+
+@bp.route('/stats/cache')
+def cache_stats():
+  return cache.stats()
+
+@bp.route('/stats/replicas')
+def replica_stats():
+  return {'replicas': current_app.extensions['replicas'].stats()}
+
+@bp.route('/stats/pool')
+def pool_stats():
+  # Connection checkout wait times, plus the pool's current occupancy when it is a TimedQueuePool
+  pool = db.engine.pool
+  if not hasattr(pool, 'stats'):
+      return {'pool': pool.status()}
+  return dict(pool.stats.snapshot(), pool = pool.status(), size = pool.size(), checked_out = pool.checkedout(), overflow = pool.overflow())
+
+#----------------------------------------------------------------------------#
+# Conditional requests.
+#----------------------------------------------------------------------------#
 
-app.jinja_env.filters['datetime'] = format_datetime
+# Every write to a venue, artist or show stamps its updated_at, including the counter
+# updates a show's insert, update or delete makes to its venue and artist, and deleting a
+# venue or artist bumps its table's deletion count. A page's validators are a single row of
+# index lookups (max(updated_at), deletion counts, show start times) that change whenever
+# the page does; revalidating a page that has not changed costs that one query.
+
+def latest_update(model):
+  return db.select(db.func.max(model.updated_at)).scalar_subquery()
+
+def deletions(model):
+  return db.select(TableVersion.deletions).where(TableVersion.name == model.__tablename__).scalar_subquery()
+
+def count_deletion(mapper, connection, target):
+  # Upserting the table's deletion count, whose row is created by the first deletion
+  table = TableVersion.__table__
+  insert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}[connection.dialect.name](table)
+  connection.execute(
+    insert.values(name = mapper.local_table.name, deletions = 1)
+      .on_conflict_do_update(index_elements = ['name'], set_ = {'deletions': table.c.deletions + 1})
+  )
+
+for model in (Venue, Artist):
+    event.listen(model, 'after_delete', count_deletion)
+
+def listing_validators(*models):
+  # Deletion counts catch deletions; shows need none since deleting one updates its venue and artist
+  columns = []
+  for model in models:
+      columns += [latest_update(model)] if model is Show else [deletions(model), latest_update(model)]
+  return db.select(*columns)
+
+def latest_start(foreign_key, entity_id):
+  # When the entity's last show started, moving from its upcoming to its past shows: a descent
+  # of the (venue_id / artist_id, start_time) index
+  return db.select(db.func.max(Show.start_time)) \
+    .where(foreign_key == entity_id, Show.start_time <= datetime.now()) \
+    .scalar_subquery()
+
+def venue_validators(venue_id):
+  # The venue, the artists it lists, and when its last show started, which moves the show from
+  # upcoming to past without any write; being a time, it also advances Last-Modified
+  performer_update = db.select(db.func.max(Artist.updated_at)).join(Show, Show.artist_id == Artist.id) \
+    .where(Show.venue_id == venue_id) \
+    .scalar_subquery()
+  return db.select(Venue.updated_at, performer_update, latest_start(Show.venue_id, venue_id)) \
+    .where(Venue.id == venue_id)
+
+def artist_validators(artist_id):
+  # The artist, the venues it lists, and when its last show started
+  venue_update = db.select(db.func.max(Venue.updated_at)).join(Show, Show.venue_id == Venue.id) \
+    .where(Show.artist_id == artist_id) \
+    .scalar_subquery()
+  return db.select(Artist.updated_at, venue_update, latest_start(Show.artist_id, artist_id)) \
+    .where(Artist.id == artist_id)
+
+def conditional(validators):
+  # Serves a page with an ETag and Last-Modified derived from validators(**view_args) and the
+  # query arguments, and answers 304 without running the view when the client's copy is still
+  # current. The view finds the ETag in g.etag, to read cached data assembled under the same
+  # validators.
+  def decorator(view):
+      @wraps(view)
+      def conditional_view(**kwargs):
+          values = db.session.execute(validators(**kwargs)).one_or_none()
+          if values is None:
+              return view(**kwargs)
+          timestamps = [value for value in values if isinstance(value, datetime)]
+          last_modified = max(timestamps) if timestamps else None
+          args = sorted(request.args.items(multi = True))
+          etag = hashlib.sha1(dumps([current_app.config['RELEASE'], *values, args])).hexdigest()
+          g.etag = etag
+
+          # Flashed messages are shown once, so a page carrying them is always sent in full
+          if '_flashes' in session:
+              return view(**kwargs)
+
+          if is_resource_modified(request.environ, etag = etag, last_modified = last_modified):
+              response = make_response(view(**kwargs))
+          else:
+              response = Response(status = 304)
+          response.set_etag(etag)
+          response.last_modified = last_modified
+          response.cache_control.no_cache = True
+          return response
+      return conditional_view
+  return decorator
+
+#----------------------------------------------------------------------------#
+# Unit of work.
+#----------------------------------------------------------------------------#
+
+# The write views make their changes inside unit_of_work(), one transaction on the request's
+# session. New rows get their ids from the INSERT's RETURNING clause as the session flushes, and
+# objects stay loaded after the commit. Flask-SQLAlchemy removes the session when the app
+# context ends, so views never close it themselves.
+
+@contextmanager
+def unit_of_work():
+  # Commits the block's changes when it completes; rolls them back and re-raises when it fails
+  try:
+      yield db.session
+      db.session.commit()
+  except BaseException:
+      db.session.rollback()
+      raise
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
-@app.route('/')
+@bp.route('/')
 def index():
   return render_template('pages/home.html')
 
 
 #  Venues
 #  ----------------------------------------------------------------
-@app.route('/venues')
-def venues():
-  # Querying all locations by city-state from the Venues table
-  all_locations = Venue.query.order_by(Venue.state, Venue.city).all()
 
-  # Instantiating an emtpy object to append items that will be returned to user
-  data = []
-
-  # Looping through areas to append appropriate Venue data
-  for location in all_locations:
-      # Collecting venues in each city (by each state)
-      venues_in_location = Venue.query.filter_by(state = location.state).filter_by(city = location.city).all()
-      # Creating an empty array specifically to collect venue information
-      venue_data = []
-      # Looping through location venues to collect their data
-      for venue in venues_in_location:
-          venue_data.append({
-            'id': venue.id,
-            'name': venue.name,
-            'num_upcoming_shows': len(db.session.query(Show).filter(Show.venue_id == 1).filter(Show.start_time > datetime.now()).all())
-          })
-      # Appending all necessary data to 'data' object returned to user
-      data.append({
-        'city': location.city,
-        'state': location.state,
-        'venues': venue_data
+def area_listing(genre = None):
+  # The areas having venues, with their maintained venue counts; for a genre, the areas
+  # having venues listing it, with those venues counted off the genres index instead
+  if genre is None:
+      return db.select(Area.id, Area.city, Area.state, Area.venue_count).where(Area.venue_count > 0)
+  return db.select(Area.id, Area.city, Area.state, db.func.count(Venue.id).label('venue_count')) \
+    .join(Venue, Venue.area_id == Area.id) \
+    .where(has_genre(Venue, genre)) \
+    .group_by(Area.id, Area.city, Area.state)
+
+def area_venues(area_ids, per_area, genre = None):
+  # The first venues of each area (listing genre, if given), by id. Each area is its own
+  # LIMITed range of the (area_id, id) index, so a crowded area costs no more than a quiet one.
+  criteria = [has_genre(Venue, genre)] if genre is not None else []
+  return db.union_all(*[
+    db.select(venue_listing().add_columns(Venue.area_id).where(Venue.area_id == area_id, *criteria).order_by(Venue.id).limit(per_area).subquery())
+    for area_id in area_ids
+  ])
+
+def area_venue_listing(area_id, genre = None):
+  # The venues of an area (listing genre, if given), off the (area_id, id) index
+  statement = venue_listing().add_columns(Venue.area_id).where(Venue.area_id == area_id)
+  return statement.where(has_genre(Venue, genre)) if genre is not None else statement
+
+def venue_areas(areas, venues):
+  # Puts the venue rows under their areas, keeping the areas' order
+  venues_by_area = {}
+  for venue in venues:
+      venues_by_area.setdefault(venue.area_id, []).append({
+        'id': venue.id,
+        'name': venue.name,
+        'num_upcoming_shows': venue.num_upcoming_shows
       })
-
-  return render_template('pages/venues.html', areas=data);
-
-@app.route('/venues/search', methods=['POST'])
+  return [{
+    'id': area.id,
+    'city': area.city,
+    'state': area.state,
+    'num_venues': area.venue_count,
+    'venues': venues_by_area.get(area.id, [])
+  } for area in areas]
+
+@bp.route('/venues')
+@conditional(lambda: listing_validators(Venue))
+def venues():
+  # Querying one page of areas, then the first few venues of each, narrowed to ?genre= if given
+  genre = canonical_genre(request.args.get('genre'))
+  areas, pagination = keyset_paginate(area_listing(genre), [Area.state, Area.city])
+  venues = db.session.execute(area_venues([area.id for area in areas], current_app.config['VENUES_PER_AREA'], genre)).all() if areas else []
+
+  return render_template('pages/venues.html', areas = venue_areas(areas, venues), pagination = pagination,
+    genre = genre, genres = genre_facets(Venue))
+
+@bp.route('/areas/<int:area_id>')
+@conditional(lambda area_id: listing_validators(Venue))
+def show_area(area_id):
+  # Querying one page of the area's venues off the (area_id, id) index
+  area = db.session.get(Area, area_id)
+  if area is None:
+      abort(404)
+  genre = canonical_genre(request.args.get('genre'))
+  venues, pagination = keyset_paginate(area_venue_listing(area_id, genre), [Venue.id])
+
+  return render_template('pages/venues.html', areas = venue_areas([area], venues), pagination = pagination,
+    genre = genre, genres = genre_facets(Venue, area_id))
+
+@bp.route('/venues/search', methods=['GET', 'POST'])
+@read_only
 def search_venues():
-  # Bringing in 'search' information from web UI form
-  # Special thanks to this Stack Overflow post for help: https://stackoverflow.com/questions/39384923/how-to-use-like-operator-in-sqlalchemy
-  search_term = request.form.get('search_term', '')
-  search_result = db.session.query(Venue).filter(Venue.name.ilike(f'%{search_term}%')).all()
+  # Bringing in 'search' information from web UI form (or from the pagination links)
+  search_term = request.values.get('search_term', '')
+  page = max(request.values.get('page', 1, type = int), 1)
+  per_page = current_app.config['SEARCH_RESULTS_PER_PAGE']
+
+  # Fetching one page of ranked results along with the total number of matches
+  search_result = search_query(Venue, search_term) \
+    .add_columns(Venue.upcoming_shows_count.label('num_upcoming_shows'), db.func.count().over().label('total')) \
+    .limit(per_page).offset((page - 1) * per_page).all()
 
   # Instantiating an empty object to append items that will be returned to user
   data = []
@@ -146,49 +916,34 @@ def search_venues():
       data.append({
         'id': result.id,
         'name': result.name,
-        'num_upcoming_shows': len(db.session.query(Show).filter(Show.venue_id == result.id).filter(Show.start_time > datetime.now()).all())
+        'num_upcoming_shows': result.num_upcoming_shows
       })
 
   # Establishing the formal response by appending how many results were found with the results themselves
   response = {
-    'count': len(search_result),
-    'data': data
+    'count': search_result[0].total if search_result else 0,
+    'data': data,
+    'page': page,
+    'per_page': per_page
   }
 
-  return render_template('pages/search_venues.html', results = response, search_term = request.form.get('search_term', ''))
-
-@app.route('/venues/<int:venue_id>')
-def show_venue(venue_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-
-  # Querying the venue with the provided ID
-  venue = Venue.query.get(venue_id)
+  return render_template('pages/search_venues.html', results = response, search_term = search_term)
 
-  # Querying all past and upcoming shows with the venue_id
-  all_past_shows = db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id).filter(Show.start_time > datetime.now()).all()
-  all_upcoming_shows = db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id).filter(Show.start_time <= datetime.now()).all()
+def venue_page(venue, shows, now):
+  # Assembles the venue page payload from the venue and its shows (with their artists),
+  # returning it with how long it stays valid
 
   # Creating empty containers to append respective past / upcming show info
   upcoming_shows = []
   past_shows = []
 
-  # Appending past show information
-  for show in all_past_shows:
-      past_shows.append({
-        'artist_id': show.artist_id,
-        'artist_name': show.artist.name,
-        'artist_image_link': show.artist.image_link,
-        'start_time': show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-      })
-
-  # Appending upcoming show information
-  for show in all_upcoming_shows:
-      upcoming_shows.append({
+  # Splitting the shows into past / upcoming around a single timestamp, so every show lands on exactly one side
+  for show in shows:
+      (upcoming_shows if show.start_time > now else past_shows).append({
         'artist_id': show.artist_id,
         'artist_name': show.artist.name,
         'artist_image_link': show.artist.image_link,
-        'start_time': show.start_time.strftime('%Y-%m-%d %H:%M:%S')
+        'start_time': show.start_time
       })
 
   # Creating data object to return all appropriate information
@@ -211,91 +966,105 @@ def show_venue(venue_id):
     'upcoming_shows_count': len(upcoming_shows)
   }
 
+  return data, page_ttl(upcoming_shows, now)
+
+def venue_page_data(venue_id):
+  # Querying the venue with the provided ID, then all of its shows (and their artists) at once
+  venue = db.session.get(Venue, venue_id)
+  if venue is None:
+      abort(404)
+  return venue_page(venue, db.session.scalars(venue_shows(venue_id)), datetime.now())
+
+@bp.route('/venues/<int:venue_id>')
+@conditional(venue_validators)
+def show_venue(venue_id):
+  # shows the venue page with the given venue_id
+
+  # Serving the assembled page from the cache, rebuilding it on a miss
+  data = cached_page_data('venue', venue_id, g.get('etag'))
+
   return render_template('pages/show_venue.html', venue = data)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@bp.route('/venues/create', methods=['GET'])
 def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@bp.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   # TODO: insert form data as a new Venue record in the db, instead
   # TODO: modify data to be the data object returned from db insertion
-  error = False
   # Creating our venue with the Venue SQLAlchemy object with info from the UI form
   try:
-      venue = Venue()
-      venue.name = request.form['name']
-      venue.city = request.form['city']
-      venue.state = request.form['state']
-      venue.address = request.form['address']
-      venue.phone = request.form['phone']
-      venue.genres = ','.join(request.form.getlist('genres'))
-      venue.facebook_link = request.form['facebook_link']
-      db.session.add(venue)
-      db.session.commit()
-  # Rolling back data in case of error
+      with unit_of_work():
+          venue = Venue()
+          venue.name = request.form['name']
+          venue.city = request.form['city']
+          venue.state = request.form['state']
+          venue.address = request.form['address']
+          venue.phone = request.form['phone']
+          venue.genres = request.form.getlist('genres')
+          venue.facebook_link = request.form['facebook_link']
+          db.session.add(venue)
+  # The unit of work has rolled back; printing out the error info
   except:
-      error = True
-      db.session.rollback()
       print(sys.exc_info())
-  # Closing session regardless of error and printing out success / error info
-  finally:
-      db.session.close()
-      if error:
-          flash('Error: Venue {} could not be listed.'.format(request.form['name']))
-      else:
-          flash('Venue {} was successfully listed!'.format(request.form['name']))
+      flash('Error: Venue {} could not be listed.'.format(request.form['name']))
+  else:
+      flash('Venue {} was successfully listed!'.format(venue.name))
 
   return render_template('pages/home.html')
 
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@bp.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   # TODO: Complete this endpoint for taking a venue_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
 
-  error = False
-  # Attempting to delete venue by provided ID
+  venue = db.session.get(Venue, venue_id)
+  if venue is None:
+      abort(404)
+
+  # Attempting to delete venue by provided ID; the venue stays readable once deleted
   try:
-      venue = Venue.query.get(venue_id)
-      db.session.delete(venue)
-      db.session.commit()
-  # Rolling back changes in case of error
+      with unit_of_work():
+          db.session.delete(venue)
   except:
-      error = True
-      db.session.rollback()
       print(sys.exc_info())
-  # Closing out session and printing final message
-  finally:
-      db.session.close()
-      if error:
-          flash('Error: Venue {} could not be deleted.'.format(venue.name))
-      else:
-          flash('Venue {} was successfully deleted.'.format(venue.name))
+      flash('Error: Venue {} could not be deleted.'.format(venue.name))
+  else:
+      invalidate_venue(venue.id)
+      flash('Venue {} was successfully deleted.'.format(venue.name))
 
   return render_template('pages/home.html')
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@bp.route('/artists')
+@conditional(lambda: listing_validators(Artist))
 def artists():
   # TODO: replace with real data returned from querying the database
-  data = db.session.query(Artist).all()
+  genre = canonical_genre(request.args.get('genre'))
+  data, pagination = keyset_paginate(artist_listing(genre), [Artist.id])
 
-  return render_template('pages/artists.html', artists=data)
+  return render_template('pages/artists.html', artists=data, pagination=pagination, genre=genre, genres=genre_facets(Artist))
 
-@app.route('/artists/search', methods=['POST'])
+@bp.route('/artists/search', methods=['GET', 'POST'])
+@read_only
 def search_artists():
-  # Getting search term from UI form
-  search_term = request.form.get('search_term', '')
-  # Returning all results using the search term
-  search_result = db.session.query(Artist).filter(Artist.name.ilike(f'%{search_term}%')).all()
+  # Getting search term from UI form (or from the pagination links)
+  search_term = request.values.get('search_term', '')
+  page = max(request.values.get('page', 1, type = int), 1)
+  per_page = current_app.config['SEARCH_RESULTS_PER_PAGE']
+
+  # Returning one page of ranked results along with the total number of matches
+  search_result = search_query(Artist, search_term) \
+    .add_columns(Artist.upcoming_shows_count.label('num_upcoming_shows'), db.func.count().over().label('total')) \
+    .limit(per_page).offset((page - 1) * per_page).all()
 
   # Instantiating empty object to hold search result info
   data = []
@@ -305,51 +1074,33 @@ def search_artists():
       data.append({
         'id': result.id,
         'name': result.name,
-        'num_upcoming_shows': len(db.session.query(Show).filter(Show.artist_id == result.id).filter(Show.start_time > datetime.now()).all())
+        'num_upcoming_shows': result.num_upcoming_shows
       })
 
   # Formalizing response with search result data object and number of results
   response = {
-    'count': len(search_result),
-    'data': data
+    'count': search_result[0].total if search_result else 0,
+    'data': data,
+    'page': page,
+    'per_page': per_page
   }
-  return render_template('pages/search_artists.html', results = response, search_term = request.form.get('search_term', ''))
-
-@app.route('/artists/<int:artist_id>')
-def show_artist(artist_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  # Querying the artist based on the artist_id
-  artist = db.session.query(Artist).get(artist_id)
+  return render_template('pages/search_artists.html', results = response, search_term = search_term)
 
-  # Querying the artists past shows
-  artist_past_shows = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id).filter(Show.start_time < datetime.now()).all()
+def artist_page(artist, shows, now):
+  # Assembles the artist page payload from the artist and its shows (with their venues),
+  # returning it with how long it stays valid
 
-  # Creating an empty container to append past show information
+  # Creating empty containers to append past / upcoming show information
   past_shows = []
-
-  # Appending previous show infomration from artist_past_shows query
-  for show in artist_past_shows:
-      past_shows.append({
-        'venue_id': show.venue_id,
-        'venue_name': show.venue.name,
-        'artist_image_link': show.venue.image_link,
-        'start_time': show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-      })
-
-  # Querying the artist's upcoming shows
-  artist_upcoming_shows = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id).filter(Show.start_time >= datetime.now()).all()
-
-  # Creating an empty container to append upcoming show information
   upcoming_shows = []
 
-  # Appending upcoming show informaiton from artist_upcoming_shows
-  for show in artist_upcoming_shows:
-      upcoming_shows.append({
+  # Splitting the shows into past / upcoming around a single timestamp, so every show lands on exactly one side
+  for show in shows:
+      (upcoming_shows if show.start_time > now else past_shows).append({
         'venue_id': show.venue_id,
         'venue_name': show.venue.name,
-        'artist_image_link': show.venue.image_link,
-        'start_time': show.start_time.strftime('%Y-%m-%d %H:%M:%S')
+        'venue_image_link': show.venue.image_link,
+        'start_time': show.start_time
       })
 
   # Packaging all data about the artist to return to the user
@@ -371,6 +1122,23 @@ def show_artist(artist_id):
     'upcoming_shows_count': len(upcoming_shows)
   }
 
+  return data, page_ttl(upcoming_shows, now)
+
+def artist_page_data(artist_id):
+  # Querying the artist based on the artist_id, then all of its shows (and their venues) at once
+  artist = db.session.get(Artist, artist_id)
+  if artist is None:
+      abort(404)
+  return artist_page(artist, db.session.scalars(artist_shows(artist_id)), datetime.now())
+
+@bp.route('/artists/<int:artist_id>')
+@conditional(artist_validators)
+def show_artist(artist_id):
+  # shows the artist page with the given artist_id
+
+  # Serving the assembled page from the cache, rebuilding it on a miss
+  data = cached_page_data('artist', artist_id, g.get('etag'))
+
   return render_template('pages/show_artist.html', artist = data)
 
 
@@ -379,13 +1147,14 @@ def show_artist(artist_id):
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@reads_primary
 def edit_artist(artist_id):
   # Importing information from the artist edit UI form
   form = ArtistForm()
 
   # Querying the artist to edit by provided artist_id
-  artist = Artist.query.get(artist_id)
+  artist = db.session.get(Artist, artist_id)
 
   if artist:
       form.name.data = artist.name
@@ -400,49 +1169,46 @@ def edit_artist(artist_id):
 
   return render_template('forms/edit_artist.html', form = form, artist = artist)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   # TODO: take values from the form submitted, and update existing
   # artist record with ID <artist_id> using the new attributes
 
-  error = False
   # Querying the artist information with the provided artist_id
-  artist = Artist.query.get(artist_id)
+  artist = db.session.get(Artist, artist_id)
+  if artist is None:
+      abort(404)
 
   # Attempting to appropriately update artist information
   try:
-      artist.name = request.form['name']
-      artist.city = request.form['city']
-      artist.state = request.form['state']
-      artist.phone = request.form['phone']
-      artist.genres = request.form.getlist('genres')
-      artist.website = request.form['website']
-      artist.facebook_link = request.form['facebook_link']
-      artist.image_link = request.form['image_link']
-      artist.seeking_venue = True if 'seeking_venue' in request.form else False
-      artist.seeking_description = request.form['seeking_description']
-      db.session.commit()
-  # Handling error scenarios by rolling back info
+      with unit_of_work():
+          artist.name = request.form['name']
+          artist.city = request.form['city']
+          artist.state = request.form['state']
+          artist.phone = request.form['phone']
+          artist.genres = request.form.getlist('genres')
+          artist.website = request.form['website']
+          artist.facebook_link = request.form['facebook_link']
+          artist.image_link = request.form['image_link']
+          artist.seeking_venue = True if 'seeking_venue' in request.form else False
+          artist.seeking_description = request.form['seeking_description']
+  # Handling error scenarios; the unit of work has rolled back
   except:
-    error = True
-    db.session.rollback()
     print(sys.exc_info())
-  # Closing the session and displaying appropriate message
-  finally:
-    db.session.close()
-    if error:
-        flash('An error occurred. Artist {} could not be updated.'.format(artist_id))
-    else:
-        flash('Artist {} was successfully updated!'.format(artist_id))
+    flash('An error occurred. Artist {} could not be updated.'.format(artist_id))
+  else:
+    invalidate_artist(artist_id)
+    flash('Artist {} was successfully updated!'.format(artist.name))
 
-  return redirect(url_for('show_artist', artist_id = artist_id))
+  return redirect(url_for('main.show_artist', artist_id = artist_id))
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@reads_primary
 def edit_venue(venue_id):
   form = VenueForm()
 
   # Getting existing venue information using venue_id
-  venue = Venue.query.get(venue_id)
+  venue = db.session.get(Venue, venue_id)
 
   # Appropriately updating venue data from form
   if venue:
@@ -459,88 +1225,74 @@ def edit_venue(venue_id):
 
   return render_template('forms/edit_venue.html', form = form, venue = venue)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   # TODO: take values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes
-  error = False
-
   #Querying venue information based on venue_id
-  venue = Venue.query.get(venue_id)
+  venue = db.session.get(Venue, venue_id)
+  if venue is None:
+      abort(404)
 
   # Attempting to update venue information
   try:
-      venue.name = request.form['name']
-      venue.genres = request.form.getlist('genres')
-      venue.city = request.form['city']
-      venue.state = request.form['state']
-      venue.address = request.form['address']
-      venue.phone = request.form['phone']
-      venue.website = request.form['website']
-      venue.facebook_link = request.form['facebook_link']
-      venue.image_link = request.form['image_link']
-      venue.seeking_talent = True if 'seeking_talent' in request.form else False
-      venue.seeking_description = request.form['seeking_description']
-      db.session.commit()
-  # Handling error scenarios by implementing rollback
+      with unit_of_work():
+          venue.name = request.form['name']
+          venue.genres = request.form.getlist('genres')
+          venue.city = request.form['city']
+          venue.state = request.form['state']
+          venue.address = request.form['address']
+          venue.phone = request.form['phone']
+          venue.website = request.form['website']
+          venue.facebook_link = request.form['facebook_link']
+          venue.image_link = request.form['image_link']
+          venue.seeking_talent = True if 'seeking_talent' in request.form else False
+          venue.seeking_description = request.form['seeking_description']
+  # Handling error scenarios; the unit of work has rolled back
   except:
-      error = True
-      db.session.rollback()
       print(sys.exc_info())
-  # Closing out session and showing appropriate message
-  finally:
-      db.session.close()
-      if error:
-          flash('Error: Venue {} could not be updated.'.format(venue_id))
-      else:
-          flash('Venue {} was successfully updated.'.format(venue_id))
+      flash('Error: Venue {} could not be updated.'.format(venue_id))
+  else:
+      invalidate_venue(venue_id)
+      flash('Venue {} was successfully updated.'.format(venue.name))
 
-  return redirect(url_for('show_venue', venue_id = venue_id))
+  return redirect(url_for('main.show_venue', venue_id = venue_id))
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@bp.route('/artists/create', methods=['GET'])
 def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form = form)
 
-@app.route('/artists/create', methods=['POST'])
+@bp.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
   # TODO: insert form data as a new Venue record in the db, instead
   # TODO: modify data to be the data object returned from db insertion
-  error = False
-
   # Attempting to create artist entry with form information
   try:
-      artist = Artist(
-        name = request.form['name'],
-        city = request.form['city'],
-        state = request.form['state'],
-        phone = request.form['phone'],
-        genres = request.form.getlist('genres'),
-        website = request.form['website'],
-        facebook_link = request.form['facebook_link'],
-        image_link = request.form['image_link'],
-        seeking_venue = True if 'seeking_venue' in request.form else False,
-        seeking_description = request.form['seeking_description']
-      )
-
-      db.session.add(artist)
-      db.session.commit()
-  # Handling error scenarios with rollback
+      with unit_of_work():
+          artist = Artist(
+            name = request.form['name'],
+            city = request.form['city'],
+            state = request.form['state'],
+            phone = request.form['phone'],
+            genres = request.form.getlist('genres'),
+            website = request.form['website'],
+            facebook_link = request.form['facebook_link'],
+            image_link = request.form['image_link'],
+            seeking_venue = True if 'seeking_venue' in request.form else False,
+            seeking_description = request.form['seeking_description']
+          )
+          db.session.add(artist)
+  # Handling error scenarios; the unit of work has rolled back
   except:
-      error = True
-      db.session.rollback()
       print(sys.exc_info())
-  # CLosing session and showing appropriate message
-  finally:
-      db.session.close()
-      if error:
-          flash('Error: Artist {} could not be listed.'.format(request.form['name']))
-      else:
-          flash('Artist {} was successfully listed!'.format(request.form['name']))
+      flash('Error: Artist {} could not be listed.'.format(request.form['name']))
+  else:
+      flash('Artist {} was successfully listed!'.format(artist.name))
 
   return render_template('pages/home.html')
 
@@ -548,90 +1300,502 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+def show_tiles(shows):
+  return [{
+    'venue_id': show.venue_id,
+    'venue_name': show.venue_name,
+    'artist_id': show.artist_id,
+    'artist_name': show.artist_name,
+    'artist_image_link': show.artist_image_link,
+    'start_time': show.start_time
+  } for show in shows]
+
+@bp.route('/shows')
+@conditional(lambda: listing_validators(Show, Venue, Artist))
 def shows():
   # displays list of shows at /shows
   # TODO: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
 
-  # Querying all shows
-  all_shows = db.session.query(Show).join(Artist).join(Venue).all()
-
-  # Creating an empty container to append show info to
-  data = []
-
-  # Looping through all shows to append show information appropriately
-  for show in all_shows:
-      data.append({
-        'venue_id': show.venue_id,
-        'venue_name': show.venue.name,
-        'artist_id': show.artist_id,
-        'artist_name': show.artist.name,
-        'start_time': show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-      })
+  # Querying one page of shows in start time order, along with the artist and venue columns shown on each tile
+  all_shows, pagination = keyset_paginate(show_listing(), [Show.start_time, Show.id])
 
-  return render_template('pages/shows.html', shows = data)
+  return render_template('pages/shows.html', shows = show_tiles(all_shows), pagination = pagination)
 
-@app.route('/shows/create')
+@bp.route('/shows/create')
 def create_shows():
   # renders form. do not touch.
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@bp.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
   # TODO: insert form data as a new Show record in the db, instead
-  error = False
+  conflicts = []
 
   # Attempting to create show
   try:
-      show = Show(
-        artist_id = request.form['artist_id'],
-        venue_id = request.form['venue_id'],
-        start_time = request.form['start_time']
-      )
-
-      db.session.add(show)
-      db.session.commit()
-  # Handling error scenarios with rollback
+      with unit_of_work():
+          start_time = parse_datetime(request.form['start_time'])
+          end_time = show_end_time(start_time, parse_datetime(request.form['end_time']) if request.form.get('end_time') else None)
+          if end_time <= start_time:
+              raise ValueError('A show must end after it starts')
+
+          show = Show(
+            artist_id = int(request.form['artist_id']),
+            venue_id = int(request.form['venue_id']),
+            start_time = start_time,
+            end_time = end_time
+          )
+
+          # Naming a missing venue or artist, then refusing to double-book them
+          conflicts = [f'there is no {kind} {entity_id}' for kind, model, entity_id in (('venue', Venue, show.venue_id), ('artist', Artist, show.artist_id))
+                       if db.session.get(model, entity_id) is None]
+          conflicts = conflicts or booking_conflicts([(show.venue_id, show.artist_id, start_time, end_time)])[0]
+          if not conflicts:
+              db.session.add(show)
+  # A concurrent booking of the same slot is caught by the exclusion constraints
+  except IntegrityError as error:
+    if booking_race(error):
+        flash('Show could not be listed: the venue or the artist was booked for that time in the meantime.')
+    else:
+        print(sys.exc_info())
+        flash('An error occurred. Show could not be listed.')
+  # Handling error scenarios; the unit of work has rolled back
   except:
-    error = True
-    db.session.rollback()
     print(sys.exc_info())
-  # CLosing session and displaying appropriate information
-  finally:
-    db.session.close()
-    if error:
-        flash('An error occurred. Show could not be listed.')
+    flash('An error occurred. Show could not be listed.')
+  else:
+    if conflicts:
+        flash('Show could not be listed: ' + ' and '.join(conflicts) + '.')
     else:
+        cache.delete(f'venue:{show.venue_id}', f'artist:{show.artist_id}')
         flash('Show was successfully listed.')
 
   return render_template('pages/home.html')
 
-@app.errorhandler(404)
+#  Export
+#  ----------------------------------------------------------------
+
+@bp.route('/export/<any(shows, venues, artists):entity>.<any(csv, jsonl):format>')
+def export(entity, format):
+  # Streams shows, venues or artists as they are fetched, optionally narrowed to the shows
+  # starting in [start, end) and / or at a venue or by an artist
+
+  # Reading the filters, rejecting malformed ones
+  try:
+      filters = {
+        'start': parse_datetime(request.args['start']) if request.args.get('start') else None,
+        'end': parse_datetime(request.args['end']) if request.args.get('end') else None,
+        'venue_id': int(request.args['venue_id']) if request.args.get('venue_id') else None,
+        'artist_id': int(request.args['artist_id']) if request.args.get('artist_id') else None
+      }
+  except (ValueError, OverflowError):
+      abort(400)
+
+  # Writing the rows out through a generator that keeps the request context, and with it the session, open
+  return Response(stream_with_context(export_lines(stream_export(entity, **filters), format)),
+    mimetype = FORMATS[format],
+    headers = {'Content-Disposition': f'attachment; filename={entity}.{format}'})
+
+#  API
+#  ----------------------------------------------------------------
+
+def api_json(data):
+  return Response(dumps(data), mimetype = 'application/json')
+
+def api_response(data):
+  # Serialises data tagged with an ETag of the body; a client sending that ETag back in
+  # If-None-Match gets an empty 304 instead, and is asked to revalidate before every reuse
+  response = api_json(data)
+  response.add_etag()
+  response.cache_control.no_cache = True
+  return response.make_conditional(request)
+
+def api_page(statement, order_by):
+  # One keyset-paginated page of projected rows, with the cursors of the neighbouring pages.
+  # The listings revalidate through @conditional, which tags the page with its ETag.
+  rows, pagination = keyset_paginate(statement, order_by)
+  return api_json(dict(pagination, data = [dict(row._mapping) for row in rows]))
+
+def genre_filtered(statement, model):
+  # Narrows an API listing to the ?genre= given, if any
+  genre = canonical_genre(request.args.get('genre'))
+  return statement.where(has_genre(model, genre)) if genre is not None else statement
+
+@bp.route('/api/v1/venues')
+@conditional(lambda: listing_validators(Venue))
+def api_venues():
+  return api_page(genre_filtered(db.select(
+      Venue.id,
+      Venue.name,
+      Venue.city,
+      Venue.state,
+      Venue.genres,
+      Venue.image_link,
+      Venue.upcoming_shows_count,
+      Venue.past_shows_count
+    ), Venue), [Venue.id])
+
+@bp.route('/api/v1/venues/available')
+def api_available_venues():
+  # Venues in a city with no show overlapping [start, end), optionally only those listing a
+  # genre. Bookers repeat the same searches, so pages are cached for AVAILABILITY_CACHE_TTL
+  # seconds, which is as long as a new booking can take to show up.
+  try:
+      city, state = request.args['city'].strip(), request.args['state'].strip().upper()
+      start, end = parse_datetime(request.args['start']), parse_datetime(request.args['end'])
+  except (KeyError, ValueError, OverflowError):
+      abort(400)
+  if end <= start:
+      abort(400)
+  genre = canonical_genre(request.args.get('genre'))
+
+  key = f'available:{request.query_string.decode()}'
+  data = cache.get(key)
+  if data is None:
+      statement = db.select(Venue.id, Venue.name, Venue.address, Venue.city, Venue.state, Venue.genres, Venue.image_link) \
+        .where(Venue.state == state, Venue.city == city, venue_free(start, end))
+      if genre:
+          statement = statement.where(has_genre(Venue, genre))
+      rows, pagination = keyset_paginate(statement, [Venue.id])
+      data = dict(pagination, data = [dict(row._mapping) for row in rows])
+      cache.set(key, data, current_app.config['AVAILABILITY_CACHE_TTL'])
+  return api_response(data)
+
+@bp.route('/api/v1/venues/<int:venue_id>')
+def api_venue(venue_id):
+  # The venue page's data, shared with the HTML page through the cache
+  return api_response(cached_page_data('venue', venue_id))
+
+@bp.route('/api/v1/artists')
+@conditional(lambda: listing_validators(Artist))
+def api_artists():
+  return api_page(genre_filtered(db.select(
+      Artist.id,
+      Artist.name,
+      Artist.city,
+      Artist.state,
+      Artist.genres,
+      Artist.image_link,
+      Artist.upcoming_shows_count,
+      Artist.past_shows_count
+    ), Artist), [Artist.id])
+
+@bp.route('/api/v1/venues/genres')
+def api_venue_genres():
+  return api_response(genre_facets(Venue, request.args.get('area_id', type = int)))
+
+@bp.route('/api/v1/artists/genres')
+def api_artist_genres():
+  return api_response(genre_facets(Artist, request.args.get('area_id', type = int)))
+
+@bp.route('/api/v1/artists/<int:artist_id>')
+def api_artist(artist_id):
+  # The artist page's data, shared with the HTML page through the cache
+  return api_response(cached_page_data('artist', artist_id))
+
+@bp.route('/api/v1/shows')
+@conditional(lambda: listing_validators(Show, Venue, Artist))
+def api_shows():
+  return api_page(show_listing(), [Show.start_time, Show.id])
+
+@bp.route('/api/v1/shows', methods = ['POST'])
+def api_schedule_shows():
+  # Books {"shows": [...], "skip_rejected": false} in one transaction; see schedule_shows
+  body = request.get_json(silent = True)
+  if not isinstance(body, dict) or not isinstance(body.get('shows'), list):
+      abort(400)
+
+  try:
+      ids, rejects = schedule_shows(body['shows'], bool(body.get('skip_rejected')))
+  except ValueError as error:
+      return {'error': str(error)}, 400
+  # A concurrent booking of the same slot is caught by the exclusion constraints
+  except IntegrityError as error:
+      if not booking_race(error):
+          raise
+      return {'error': 'A venue or artist was booked for one of these times in the meantime'}, 409
+
+  data = {
+    'created': ids,
+    'rejected': [{'show': index, 'occurrence': occurrence, 'errors': errors} for (index, occurrence), errors in rejects]
+  }
+  return Response(dumps(data), status = 201 if ids or not rejects else 422, mimetype = 'application/json')
+
+@bp.app_errorhandler(404)
 def not_found_error(error):
+    if request.path.startswith('/api/'):
+        return {'error': 'Not found'}, 404
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(400)
+def bad_request_error(error):
+    if request.path.startswith('/api/'):
+        return {'error': 'Bad request'}, 400
+    return error
+
+@bp.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@bp.cli.command('explain')
+@click.option('--venue-id', default = 1, help = 'Venue whose detail page queries are explained.')
+@click.option('--artist-id', default = 1, help = 'Artist whose detail page queries are explained.')
+def explain(venue_id, artist_id):
+  """Prints the query plans of the detail page show queries."""
+  queries = {
+    'show_venue': venue_shows(venue_id),
+    'show_artist': artist_shows(artist_id)
+  }
+
+  # SQLite uses its own EXPLAIN QUERY PLAN syntax
+  prefix = 'EXPLAIN QUERY PLAN' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN'
+
+  for name, query in queries.items():
+      statement = query.compile(db.engine, compile_kwargs = {'literal_binds': True})
+      plan = [' '.join(str(column) for column in row) for row in db.session.execute(db.text(f'{prefix} {statement}'))]
+      uses_index = any('ix_show_' in line for line in plan)
+      click.echo(f'{name}: {"index range scan" if uses_index else "NO INDEX USED"}')
+      for line in plan:
+          click.echo(f'    {line}')
+
+@bp.cli.group()
+def counters():
+  """Maintains the denormalised venue / artist show counters."""
+
+@counters.command('rebuild')
+def rebuild_counters():
+  """Recounts the show counters of every venue and artist."""
+  now = datetime.now()
+  venues = refresh_show_counts(Venue, now)
+  artists = refresh_show_counts(Artist, now)
+  db.session.commit()
+  click.echo(f'Rebuilt show counters for {venues} venues and {artists} artists.')
+
+@counters.command('roll')
+@click.option('--minutes', default = 60, help = 'Recount entities with shows that started this recently; schedule the command more often than this.')
+def roll_counters(minutes):
+  """Moves shows that have started from the upcoming to the past counters."""
+  now = datetime.now()
+  started = db.and_(Show.start_time > now - timedelta(minutes = minutes), Show.start_time <= now)
+  venues = refresh_show_counts(Venue, now, db.select(Show.venue_id).where(started))
+  artists = refresh_show_counts(Artist, now, db.select(Show.artist_id).where(started))
+  db.session.commit()
+  click.echo(f'Rolled show counters forward for {venues} venues and {artists} artists.')
+
+# Model columns loaded from import files alongside the fields their web forms validate
+IMPORT_EXTRAS = {
+  Venue: ('website', 'seeking_talent', 'seeking_description'),
+  Artist: ('seeking_venue', 'seeking_description')
+}
+
+def import_rows(path, table, prepare, chunk_size):
+  # Streams a file through prepare() and loads the accepted rows, committing chunk by chunk
+  # so memory stays bounded; returns the number of rows loaded
+  loaded = rejected = 0
+  start = time.perf_counter()
+  try:
+      for chunk in chunked(read_records(path), chunk_size):
+          rows, rejects = prepare(chunk)
+          for line_number, errors in sorted(rejects, key = lambda reject: reject[0]):
+              click.echo(f'{path}:{line_number}: rejected {errors}', err = True)
+          rejected += len(rejects)
+
+          if rows:
+              try:
+                  load_rows(db.session.connection(), table, rows)
+                  db.session.commit()
+              except Exception as error:
+                  db.session.rollback()
+                  raise click.ClickException(f'{path}:{chunk[0][0]}-{chunk[-1][0]}: {error}')
+          loaded += len(rows)
+
+          rate = loaded / max(time.perf_counter() - start, 1e-6)
+          click.echo(f'{table.name}: {loaded} loaded, {rejected} rejected ({rate:.0f} rows/s)', err = True)
+  except ValueError as error:
+      raise click.ClickException(str(error))
+  return loaded
+
+def prepare_entities(model, form, chunk, areas):
+  # Validates venue / artist records with the web form, adding the columns the form does not
+  # cover and the areas of their cities, which are collected into areas for recounting
+  rows, rejects = [], []
+  columns = {column.name: column for column in model.__table__.columns}
+  for line_number, record in chunk:
+      data, errors = validate(form, record)
+      if errors:
+          rejects.append((line_number, errors))
+          continue
+      row = {name: value for name, value in data.items() if name in columns}
+      for name in IMPORT_EXTRAS[model]:
+          value = record.get(name)
+          row[name] = to_bool(value) if isinstance(columns[name].type, db.Boolean) else (value or None)
+      rows.append(row)
+
+  keys = [area_key(row.get('city'), row.get('state')) for row in rows]
+  ids = area_ids(db.session.connection(), keys)
+  for row, key in zip(rows, keys):
+      row['area_id'] = ids.get(key)
+  areas.update(ids.values())
+  return rows, rejects
+
+def import_entities(model, form, path, chunk_size):
+  # Loads venues / artists, then recounts the areas they landed in, even after a failed chunk,
+  # since COPY and executemany bypass the ORM events that keep the area counts current
+  areas = set()
+  try:
+      return import_rows(path, model.__table__, lambda chunk: prepare_entities(model, form, chunk, areas), chunk_size)
+  finally:
+      db.session.rollback()
+      for ids in chunked(sorted(areas), chunk_size):
+          refresh_area_counts(ids)
+          db.session.commit()
+
+@bp.cli.group('import')
+def import_data():
+  """Bulk loads venues, artists and shows from CSV or JSONL files.
+
+  Records are validated with the same forms as the web pages; CSV genres are
+  comma-separated within their cell. Shows refer to their venue and artist by
+  venue_id / artist_id or by exact venue / artist name.
+  """
+
+@import_data.command('venues')
+@click.argument('path', type = click.Path(exists = True, dir_okay = False))
+@click.option('--chunk-size', default = 10000, help = 'Records validated and loaded per transaction.')
+def import_venues(path, chunk_size):
+  """Loads venues from a CSV or JSONL file."""
+  form = VenueForm(formdata = None, meta = {'csrf': False})
+  loaded = import_entities(Venue, form, path, chunk_size)
+  click.echo(f'Imported {loaded} venues.')
+
+@import_data.command('artists')
+@click.argument('path', type = click.Path(exists = True, dir_okay = False))
+@click.option('--chunk-size', default = 10000, help = 'Records validated and loaded per transaction.')
+def import_artists(path, chunk_size):
+  """Loads artists from a CSV or JSONL file."""
+  form = ArtistForm(formdata = None, meta = {'csrf': False})
+  loaded = import_entities(Artist, form, path, chunk_size)
+  click.echo(f'Imported {loaded} artists.')
+
+@import_data.command('shows')
+@click.argument('path', type = click.Path(exists = True, dir_okay = False))
+@click.option('--chunk-size', default = 10000, help = 'Records validated and loaded per transaction.')
+def import_shows(path, chunk_size):
+  """Loads shows from a CSV or JSONL file and recounts the affected show counters."""
+  form = ShowForm(formdata = None, meta = {'csrf': False})
+  touched = {Venue: set(), Artist: set()}
+  try:
+      loaded = import_rows(path, Show.__table__, lambda chunk: prepare_shows(form, chunk, touched), chunk_size)
+  finally:
+      # COPY and executemany bypass the ORM events that keep the counters current, so the
+      # venues and artists that gained shows are recounted, even after a failed chunk
+      now = datetime.now()
+      for model, prefix in ((Venue, 'venue'), (Artist, 'artist')):
+          for ids in chunked(sorted(touched[model]), chunk_size):
+              refresh_show_counts(model, now, ids)
+              db.session.commit()
+              cache.delete(*(f'{prefix}:{entity_id}' for entity_id in ids))
+  click.echo(f'Imported {loaded} shows.')
+
+@bp.cli.command('schedule')
+@click.argument('source', type = click.File('r'), default = '-')
+@click.option('--skip-rejected', is_flag = True, help = 'Book the valid shows even when others are rejected.')
+def schedule(source, skip_rejected):
+  """Books a batch of shows given as JSON, all in one transaction.
+
+  SOURCE (standard input by default) holds a list of shows, each with a
+  venue_id / venue, artist_id / artist, start_time and optional end_time.
+  A show with an 'rrule' such as "FREQ=WEEKLY;COUNT=52" repeats from its
+  start time. Nothing is booked if any show is rejected, unless
+  --skip-rejected.
+  """
+  try:
+      entries = json.load(source)
+      if not isinstance(entries, list):
+          raise ValueError('expected a list of shows')
+      ids, rejects = schedule_shows(entries, skip_rejected)
+  except ValueError as error:
+      raise click.ClickException(str(error))
+  for (index, occurrence), errors in rejects:
+      click.echo(f'show {index}, occurrence {occurrence}: rejected {errors}', err = True)
+  click.echo(f'Scheduled {len(ids)} shows.')
+  if rejects and not ids:
+      sys.exit(1)
+
+@bp.cli.command('export')
+@click.argument('entity', type = click.Choice(['shows', 'venues', 'artists']))
+@click.option('--format', type = click.Choice(sorted(FORMATS)), default = 'jsonl', help = 'Output format.')
+@click.option('--output', type = click.File('w'), default = '-', help = 'File to write to; standard output by default.')
+@click.option('--start', type = click.DateTime(), help = 'Only shows starting at or after this time.')
+@click.option('--end', type = click.DateTime(), help = 'Only shows starting before this time.')
+@click.option('--venue-id', type = int, help = 'Only shows at this venue.')
+@click.option('--artist-id', type = int, help = 'Only shows by this artist.')
+def export_data(entity, format, output, start, end, venue_id, artist_id):
+  """Streams shows, venues or artists out as CSV or JSON lines.
+
+  The output can be loaded back with 'flask import'. Venues and artists are
+  narrowed to those with a show matching the filters.
+  """
+  result = stream_export(entity, start = start, end = end, venue_id = venue_id, artist_id = artist_id)
+  for lines in export_lines(result, format):
+      output.write(lines)
 
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
 
+def create_app(profile = None):
+  # Builds the application for a config profile: a name from config.profiles or a config
+  # class, FYYUR_CONFIG's by default. Nothing connects to the database here, so the app can be
+  # built in a server's master process before it forks its workers (see gunicorn.conf.py).
+  app = Flask(__name__)
+  profile = profile or os.environ.get('FYYUR_CONFIG', 'development')
+  app.config.from_object(config.profiles[profile] if isinstance(profile, str) else profile)
+  if not app.config['SECRET_KEY']:
+      raise RuntimeError('Set SECRET_KEY: every worker must sign sessions and CSRF tokens with the same key')
+  check_workers(app, int(os.environ.get('WEB_CONCURRENCY', 1)))
+
+  moment.init_app(app)
+  db.init_app(app)
+  migrate.init_app(app, db)
+  app.extensions['cache'] = make_cache(app.config)
+  SQLInstrumentation(app)
+  ReplicaSet(app)
+  app.register_blueprint(bp)
+
+  if not app.debug:
+      file_handler = FileHandler('error.log')
+      file_handler.setFormatter(
+          Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+      )
+      app.logger.setLevel(logging.INFO)
+      file_handler.setLevel(logging.INFO)
+      app.logger.addHandler(file_handler)
+      app.logger.info('errors')
+  return app
+
+def check_workers(app, workers):
+  # Refuses to serve from several processes with the memory cache outside development and tests.
+  # create_app() checks WEB_CONCURRENCY; gunicorn.conf.py checks the worker count it settled on.
+  if workers > 1 and app.config['CACHE_BACKEND'] == 'memory' and not (app.debug or app.testing):
+      raise RuntimeError(f'Set CACHE_BACKEND=redis: a write only clears the memory cache of the worker serving it, '
+                         f'so the other {workers - 1} workers would go on serving stale pages')
+
+def dispose_engines(app):
+  # Drops the pooled connections a forked worker inherited from its parent, without closing
+  # them under the parent, so that the worker opens its own
+  with app.app_context():
+      for engine in [*db.engines.values(), *app.extensions['replicas'].engines]:
+          engine.dispose(close = False)
+
 # Default port:
 if __name__ == '__main__':
-    app.run(debug = True)
+    create_app().run(debug = True)
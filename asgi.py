@@ -0,0 +1,190 @@
+"""ASGI entry point serving the browse pages from async views.
+
+The read-only pages (/, /venues, /artists, /shows and the area, venue and artist
+pages) are served by a Quart app through SQLAlchemy's async engine, so a
+worker keeps many requests in flight while they wait on the database, and a
+detail page fetches its venue or artist and its shows concurrently on two
+connections. Every other request (forms, search, the API, exports) is passed
+through to the Flask app. Needs quart, and asyncpg or aiosqlite:
+
+    pip install quart asyncpg
+    hypercorn --workers 4 --bind 0.0.0.0:8000 asgi:application
+"""
+import asyncio
+from datetime import datetime
+
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from quart import Blueprint, Quart, abort, render_template, request
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.exceptions import HTTPException
+
+from app import (create_app, format_datetime, venue_shows, artist_shows, artist_listing, show_listing,
+                 area_listing, area_venues, area_venue_listing, venue_areas, show_tiles, venue_page, artist_page,
+                 keyset_page, canonical_genre, genre_counts)
+from models import Area, Venue, Artist, Show
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite'
+}
+
+
+def async_engine(config):
+    # The configured database through its asyncio driver, with the profile's pool settings.
+    # The timed sync pool and server-side cursors do not apply to async engines, and asyncpg
+    # takes the libpq '-c setting=value' options as server settings.
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    options = dict(config['SQLALCHEMY_ENGINE_OPTIONS'])
+    for option in ('poolclass', 'slow_checkout', 'execution_options'):
+        options.pop(option, None)
+    libpq_options = options.pop('connect_args', {}).get('options')
+    if libpq_options:
+        settings = [setting.strip().split('=', 1) for setting in libpq_options.split('-c') if setting.strip()]
+        options['connect_args'] = {'server_settings': dict(settings)}
+    return create_async_engine(url.set(drivername = ASYNC_DRIVERS[url.get_backend_name()]), **options)
+
+
+app = create_app()
+cache = app.extensions['cache']
+engine = async_engine(app.config)
+Session = async_sessionmaker(engine, expire_on_commit = False)
+
+asgi = Quart(__name__)
+# Sharing the Flask app's key so flashed messages set by its forms show up on these pages
+asgi.secret_key = app.secret_key
+asgi.jinja_env.filters['datetime'] = format_datetime
+# Named like the Flask app's blueprint, so the shared templates find the same endpoints
+pages = Blueprint('main', __name__)
+
+
+async def fetch_entity(model, entity_id):
+    async with Session() as session:
+        return await session.get(model, entity_id)
+
+
+async def fetch_all(statement, scalars = False):
+    # Every call checks out its own connection, so the independent queries of one request
+    # can be awaited together
+    async with Session() as session:
+        result = await session.execute(statement)
+        return result.scalars().all() if scalars else result.all()
+
+
+def in_app(helper, *args):
+    # Calls one of the Flask app's helpers in its app context, as they read its config (page size,
+    # cache TTLs) and the genre ones check its database's dialect
+    with app.app_context():
+        return helper(*args)
+
+
+async def keyset_paginate(statement, order_by):
+    statement, page_rows = in_app(keyset_page, statement, order_by, request.args)
+    return page_rows(await fetch_all(statement))
+
+
+async def cached_page_data(kind, entity_id, model, shows, assemble):
+    # Reads a venue / artist page's data through the shared cache, assembling it on a miss
+    # from the entity and its shows, which are queried at the same time
+    # The async pages send no validators, so any version of a cached entry will do
+    key = f'{kind}:{entity_id}'
+    entry = cache.get(key)
+    if entry is None:
+        entity, entity_shows = await asyncio.gather(fetch_entity(model, entity_id), fetch_all(shows, scalars = True))
+        if entity is None:
+            abort(404)
+        data, ttl = in_app(assemble, entity, entity_shows, datetime.now())
+        entry = (None, data)
+        cache.set(key, entry, ttl)
+    return entry[1]
+
+
+async def genre_facets(model, area_id = None):
+    # The genre counts of a listing through the shared cache, counted on a miss
+    key = f'genres:{model.__tablename__}:{area_id or ""}'
+    facets = cache.get(key)
+    if facets is None:
+        rows = await fetch_all(in_app(genre_counts, model, area_id))
+        facets = [{'genre': genre, 'count': count} for genre, count in rows]
+        cache.set(key, facets, app.config['FACET_CACHE_TTL'])
+    return facets
+
+
+@pages.route('/')
+async def index():
+    return await render_template('pages/home.html')
+
+
+@pages.route('/venues')
+async def venues():
+    genre = canonical_genre(request.args.get('genre'))
+    (areas, pagination), facets = await asyncio.gather(
+        keyset_paginate(in_app(area_listing, genre), [Area.state, Area.city]), genre_facets(Venue))
+    area_ids = [area.id for area in areas]
+    venues = await fetch_all(in_app(area_venues, area_ids, app.config['VENUES_PER_AREA'], genre)) if areas else []
+    return await render_template('pages/venues.html', areas = venue_areas(areas, venues), pagination = pagination,
+                                 genre = genre, genres = facets)
+
+
+@pages.route('/areas/<int:area_id>')
+async def show_area(area_id):
+    genre = canonical_genre(request.args.get('genre'))
+    statement = in_app(area_venue_listing, area_id, genre)
+    area, (venues, pagination), facets = await asyncio.gather(
+        fetch_entity(Area, area_id), keyset_paginate(statement, [Venue.id]), genre_facets(Venue, area_id))
+    if area is None:
+        abort(404)
+    return await render_template('pages/venues.html', areas = venue_areas([area], venues), pagination = pagination,
+                                 genre = genre, genres = facets)
+
+
+@pages.route('/venues/<int:venue_id>')
+async def show_venue(venue_id):
+    data = await cached_page_data('venue', venue_id, Venue, venue_shows(venue_id), venue_page)
+    return await render_template('pages/show_venue.html', venue = data)
+
+
+@pages.route('/artists')
+async def artists():
+    genre = canonical_genre(request.args.get('genre'))
+    (data, pagination), facets = await asyncio.gather(
+        keyset_paginate(in_app(artist_listing, genre), [Artist.id]), genre_facets(Artist))
+    return await render_template('pages/artists.html', artists = data, pagination = pagination,
+                                 genre = genre, genres = facets)
+
+
+@pages.route('/artists/<int:artist_id>')
+async def show_artist(artist_id):
+    data = await cached_page_data('artist', artist_id, Artist, artist_shows(artist_id), artist_page)
+    return await render_template('pages/show_artist.html', artist = data)
+
+
+@pages.route('/shows')
+async def shows():
+    all_shows, pagination = await keyset_paginate(show_listing(), [Show.start_time, Show.id])
+    return await render_template('pages/shows.html', shows = show_tiles(all_shows), pagination = pagination)
+
+
+@asgi.errorhandler(404)
+async def not_found_error(error):
+    return await render_template('errors/404.html'), 404
+
+
+asgi.register_blueprint(pages)
+wsgi = AsyncioWSGIMiddleware(app)
+
+
+def serves(scope):
+    # Whether the request is for one of the pages (or static files) the async app serves
+    try:
+        asgi.url_map.bind('').match(scope['path'], method = scope['method'])
+    except HTTPException:
+        return False
+    return True
+
+
+async def application(scope, receive, send):
+    # Lifespan events and the browse pages go to the async app, everything else to the Flask app
+    if scope['type'] == 'http' and not serves(scope):
+        return await wsgi(scope, receive, send)
+    return await asgi(scope, receive, send)
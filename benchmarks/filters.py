@@ -0,0 +1,67 @@
+"""Measures the per-tile cost of the datetime Jinja filter.
+
+Compares the old pipeline (the view calls strftime, the filter re-parses the
+string with dateutil and formats it with babel.dates.format_datetime) with
+format_datetime on native datetimes, on a first render and on a repeat one.
+
+    python -m benchmarks.filters --tiles 1000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from app import DATETIME_FORMATS, format_datetime
+
+
+def strftime_pipeline(start_time, format):
+    # The view's strftime and the filter's parse / format, as they were before native datetimes
+    value = start_time.strftime('%Y-%m-%d %H:%M:%S')
+    return babel.dates.format_datetime(dateutil.parser.parse(value), DATETIME_FORMATS[format], locale = 'en')
+
+
+def per_tile(render, start_times, repeat):
+    # Best of repeat renders of every tile, in microseconds per tile
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for start_time in start_times:
+            render(start_time)
+        best = min(best, time.perf_counter() - start)
+    return best / len(start_times) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--tiles', type = int, default = 1000)
+    parser.add_argument('--format', choices = sorted(DATETIME_FORMATS), default = 'full')
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--random-seed', type = int, default = 1)
+    args = parser.parse_args()
+
+    # Shows start on the hour over two years, so tiles share start times as they do on /shows
+    rng = random.Random(args.random_seed)
+    origin = datetime.now().replace(minute = 0, second = 0, microsecond = 0) - timedelta(days = 365)
+    start_times = [origin + timedelta(hours = rng.randrange(2 * 365 * 24)) for _ in range(args.tiles)]
+
+    for start_time in start_times[:100]:
+        assert strftime_pipeline(start_time, args.format) == format_datetime(start_time, args.format)
+
+    def cold(start_time):
+        format_datetime.cache_clear()
+        return format_datetime(start_time, args.format)
+
+    results = {
+        'strftime + dateutil + babel': per_tile(lambda start_time: strftime_pipeline(start_time, args.format), start_times, args.repeat),
+        'native, first render': per_tile(cold, start_times, args.repeat),
+        'native, repeat render': per_tile(lambda start_time: format_datetime(start_time, args.format), start_times, args.repeat)
+    }
+    for name, microseconds in results.items():
+        print(f'{name:<30} {microseconds:8.2f} us/tile')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Compares the throughput of the sync (gunicorn) and async (hypercorn) servers.
+
+Starts each server with the same number of workers against the configured
+database, requests the browse pages from concurrent clients for a fixed
+duration and reports requests per second and latency percentiles. With
+--cold the detail page cache is disabled, so every detail page reaches the
+database.
+
+    python -m benchmarks.load --workers 2 --concurrency 32 --duration 20 --cold
+"""
+import argparse
+import os
+import random
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+
+os.environ.setdefault('SQL_INSTRUMENTATION', 'false')
+
+from app import create_app
+from models import db, Venue, Artist
+from benchmarks.run import percentile
+
+SERVERS = {
+    'sync': ['gunicorn', '--config', 'gunicorn.conf.py', '--workers', '{workers}', '--bind', '127.0.0.1:{port}'],
+    'async': ['hypercorn', '--workers', '{workers}', '--bind', '127.0.0.1:{port}', 'asgi:application']
+}
+
+
+def paths(rng):
+    # Detail pages for a spread of ids, with the listings mixed in
+    with create_app().app_context():
+        max_venue = db.session.query(db.func.max(Venue.id)).scalar() or 1
+        max_artist = db.session.query(db.func.max(Artist.id)).scalar() or 1
+    factories = [
+        lambda: f'/venues/{rng.randint(1, max_venue)}',
+        lambda: f'/artists/{rng.randint(1, max_artist)}',
+        lambda: f'/venues/{rng.randint(1, max_venue)}',
+        lambda: f'/artists/{rng.randint(1, max_artist)}',
+        lambda: '/venues',
+        lambda: '/artists',
+        lambda: '/shows'
+    ]
+    return lambda: rng.choice(factories)()
+
+
+def wait_until_ready(base_url, server, timeout = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f'server exited with status {server.returncode}')
+        try:
+            urllib.request.urlopen(base_url + '/', timeout = 1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f'server at {base_url} did not start within {timeout}s')
+
+
+def drive(base_url, next_path, concurrency, duration):
+    # Each client thread issues one request at a time until the duration is up
+    latencies, errors, lock = [], [0], threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        while time.monotonic() < deadline:
+            with lock:
+                path = next_path()
+            start = time.perf_counter()
+            try:
+                urllib.request.urlopen(base_url + path, timeout = 30).read()
+            except urllib.error.HTTPError as error:
+                if error.code != 404:
+                    with lock:
+                        errors[0] += 1
+                    continue
+            except OSError:
+                with lock:
+                    errors[0] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target = client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--workers', type = int, default = 2)
+    parser.add_argument('--concurrency', type = int, default = 32)
+    parser.add_argument('--duration', type = float, default = 20)
+    parser.add_argument('--warmup', type = float, default = 2)
+    parser.add_argument('--port', type = int, default = 8600)
+    parser.add_argument('--mode', choices = sorted(SERVERS), action = 'append')
+    parser.add_argument('--cold', action = 'store_true', help = 'disable the detail page cache')
+    parser.add_argument('--random-seed', type = int, default = 1)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.cold:
+        env['CACHE_MAX_ENTRIES'] = '0'
+
+    for offset, mode in enumerate(args.mode or sorted(SERVERS, reverse = True)):
+        port = args.port + offset
+        base_url = f'http://127.0.0.1:{port}'
+        command = [part.format(workers = args.workers, port = port) for part in SERVERS[mode]]
+        server = subprocess.Popen(command, env = env, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+        try:
+            wait_until_ready(base_url, server)
+            next_path = paths(random.Random(args.random_seed))
+            drive(base_url, next_path, args.concurrency, args.warmup)
+            latencies, errors = drive(base_url, next_path, args.concurrency, args.duration)
+        finally:
+            server.terminate()
+            server.wait()
+
+        if not latencies:
+            print(f'{mode:<6} no successful requests, {errors} errors')
+            continue
+        print(f'{mode:<6} {len(latencies) / args.duration:8.1f} req/s'
+              f'  p50 {percentile(latencies, 0.50) * 1000:7.1f} ms'
+              f'  p95 {percentile(latencies, 0.95) * 1000:7.1f} ms'
+              f'  errors {errors}')
+
+
+if __name__ == '__main__':
+    main()
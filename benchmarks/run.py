@@ -0,0 +1,306 @@
+"""Drives every route through the Flask test client and reports latency, statements and memory.
+
+Seed a catalogue first (python -m benchmarks.seed), then:
+
+    python -m benchmarks.run --save benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json
+
+With --compare the exit status is 1 when a route's p95 latency grows by more
+than --tolerance, it issues more statements than the baseline, or it answers
+with other status codes.
+
+The write routes book shows, list venues and artists, delete venues they list
+themselves and save seeded venues and artists back unchanged, so run it against
+a benchmark database rather than real data.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Benchmarks measure the app itself, not the optional per-request SQL accounting
+os.environ.setdefault('SQL_INSTRUMENTATION', 'false')
+
+from flask import current_app
+from sqlalchemy import event
+
+from app import create_app, cache, GENRES
+from models import db, Area, Venue, Artist
+from benchmarks.seed import CITIES, WORDS
+
+
+def venue_form(venue):
+    # The venue form as the edit page would submit it
+    form = {
+        'name': venue.name,
+        'city': venue.city,
+        'state': venue.state,
+        'address': venue.address,
+        'phone': venue.phone or '',
+        'genres': venue.genres or [],
+        'website': venue.website or '',
+        'facebook_link': venue.facebook_link or '',
+        'image_link': venue.image_link or '',
+        'seeking_description': venue.seeking_description or ''
+    }
+    if venue.seeking_talent:
+        form['seeking_talent'] = 'y'
+    return form
+
+
+def artist_form(artist):
+    # The artist form as the edit page would submit it
+    form = {
+        'name': artist.name,
+        'city': artist.city,
+        'state': artist.state,
+        'phone': artist.phone or '',
+        'genres': artist.genres or [],
+        'website': artist.website or '',
+        'facebook_link': artist.facebook_link or '',
+        'image_link': artist.image_link or '',
+        'seeking_description': artist.seeking_description or ''
+    }
+    if artist.seeking_venue:
+        form['seeking_venue'] = 'y'
+    return form
+
+
+def routes(rng):
+    # (name, method, request factory) for each route in app.py but the /stats pages. A factory
+    # returns the URL and the test client options (query string, form data or JSON body) of one request; detail
+    # and search routes draw a fresh id / term per request so the cache and planner see a spread,
+    # and write routes post against seeded ids.
+    max_venue = db.session.query(db.func.max(Venue.id)).scalar() or 1
+    max_artist = db.session.query(db.func.max(Artist.id)).scalar() or 1
+    max_area = db.session.query(db.func.max(Area.id)).scalar() or 1
+    terms = [city for city, state in CITIES] + list(GENRES.values()) + WORDS
+    genres = list(GENRES.values())
+
+    def venue_id():
+        return rng.randint(1, max_venue)
+
+    def artist_id():
+        return rng.randint(1, max_artist)
+
+    def slot():
+        # A two hour slot far enough ahead, and drawn from enough of them, to rarely be booked
+        return datetime(2100, 1, 1) + timedelta(hours = 2 * rng.randint(0, 10 ** 6))
+
+    def new_entity(kind):
+        city, state = rng.choice(CITIES)
+        number = rng.randint(1, 10 ** 9)
+        return {
+            'name': f'{rng.choice(WORDS)} {kind} {number}',
+            'city': city,
+            'state': state,
+            'address': f'{number % 9999 + 1} {rng.choice(WORDS)} Street',
+            'phone': '555-555-5555',
+            'genres': [rng.choice(genres)],
+            'website': f'https://{kind.lower()}{number}.example.com',
+            'facebook_link': f'https://www.facebook.com/{kind.lower()}{number}',
+            'image_link': f'https://images.example.com/{kind.lower()}s/{number}.jpg',
+            'seeking_description': ''
+        }
+
+    def edit_venue():
+        venue_id_ = venue_id()
+        return f'/venues/{venue_id_}/edit', {'data': venue_form(db.session.get(Venue, venue_id_))}
+
+    def edit_artist():
+        artist_id_ = artist_id()
+        return f'/artists/{artist_id_}/edit', {'data': artist_form(db.session.get(Artist, artist_id_))}
+
+    def delete_venue():
+        # Deleting a venue listed for the purpose, as seeded ones have shows
+        venue = Venue(**new_entity('Venue'))
+        db.session.add(venue)
+        db.session.commit()
+        return f'/venues/{venue.id}', {}
+
+    def create_show():
+        start_time = slot()
+        return '/shows/create', {'data': {
+            'artist_id': artist_id(),
+            'venue_id': venue_id(),
+            'start_time': start_time.strftime('%Y-%m-%d %H:%M')
+        }}
+
+    def schedule_shows():
+        return '/api/v1/shows', {'json': {'shows': [{
+            'venue_id': venue_id(),
+            'artist_id': artist_id(),
+            'start_time': slot().isoformat(),
+            'rrule': 'FREQ=WEEKLY;COUNT=10'
+        }], 'skip_rejected': True}}
+
+    def available():
+        city, state = rng.choice(CITIES)
+        start = datetime.now().replace(minute = 0, second = 0, microsecond = 0) + timedelta(days = rng.randint(0, 60))
+        return '/api/v1/venues/available', {'query_string': {
+            'city': city,
+            'state': state,
+            'start': start.isoformat(),
+            'end': (start + timedelta(hours = 4)).isoformat()
+        }}
+
+    return [
+        ('home', 'GET', lambda: ('/', {})),
+        ('venues', 'GET', lambda: ('/venues', {})),
+        ('venues_genre', 'GET', lambda: ('/venues', {'query_string': {'genre': rng.choice(genres)}})),
+        ('area', 'GET', lambda: (f'/areas/{rng.randint(1, max_area)}', {})),
+        ('venue_search', 'POST', lambda: ('/venues/search', {'data': {'search_term': rng.choice(terms)}})),
+        ('venue_detail', 'GET', lambda: (f'/venues/{venue_id()}', {})),
+        ('venue_create_form', 'GET', lambda: ('/venues/create', {})),
+        ('venue_create', 'POST', lambda: ('/venues/create', {'data': new_entity('Venue')})),
+        ('venue_edit_form', 'GET', lambda: (f'/venues/{venue_id()}/edit', {})),
+        ('venue_edit', 'POST', edit_venue),
+        ('venue_delete', 'DELETE', delete_venue),
+        ('artists', 'GET', lambda: ('/artists', {})),
+        ('artists_genre', 'GET', lambda: ('/artists', {'query_string': {'genre': rng.choice(genres)}})),
+        ('artist_search', 'POST', lambda: ('/artists/search', {'data': {'search_term': rng.choice(terms)}})),
+        ('artist_detail', 'GET', lambda: (f'/artists/{artist_id()}', {})),
+        ('artist_create_form', 'GET', lambda: ('/artists/create', {})),
+        ('artist_create', 'POST', lambda: ('/artists/create', {'data': new_entity('Artist')})),
+        ('artist_edit_form', 'GET', lambda: (f'/artists/{artist_id()}/edit', {})),
+        ('artist_edit', 'POST', edit_artist),
+        ('shows', 'GET', lambda: ('/shows', {})),
+        ('show_create_form', 'GET', lambda: ('/shows/create', {})),
+        ('show_create', 'POST', create_show),
+        ('export_shows', 'GET', lambda: (f'/export/shows.csv?venue_id={venue_id()}', {})),
+        ('export_artists', 'GET', lambda: (f'/export/artists.jsonl?venue_id={venue_id()}', {})),
+        ('api_venues', 'GET', lambda: ('/api/v1/venues', {})),
+        ('api_venue', 'GET', lambda: (f'/api/v1/venues/{venue_id()}', {})),
+        ('api_venue_genres', 'GET', lambda: ('/api/v1/venues/genres', {})),
+        ('api_available', 'GET', available),
+        ('api_artists', 'GET', lambda: ('/api/v1/artists', {})),
+        ('api_artist', 'GET', lambda: (f'/api/v1/artists/{artist_id()}', {})),
+        ('api_artist_genres', 'GET', lambda: ('/api/v1/artists/genres', {})),
+        ('api_shows', 'GET', lambda: ('/api/v1/shows', {})),
+        ('api_schedule', 'POST', schedule_shows)
+    ]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def measure(client, method, factory, counter):
+    # Draws the request before the clock and the statement count start, then reads the whole
+    # body so streamed responses are measured to their end
+    url, options = factory()
+    counter['statements'] = 0
+    start = time.perf_counter()
+    response = client.open(url, method = method, **options)
+    response.get_data()
+    elapsed = time.perf_counter() - start
+    response.close()
+    return elapsed, counter['statements'], response.status_code
+
+
+def run(iterations, warmup, cold, random_seed):
+    rng = random.Random(random_seed)
+    counter = {'statements': 0}
+
+    def count_statement(*args):
+        counter['statements'] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', count_statement)
+    # Failing routes are reported through their status code instead of aborting the run
+    current_app.config['PROPAGATE_EXCEPTIONS'] = False
+    client = current_app.test_client()
+    results = {}
+    for name, method, factory in routes(rng):
+        for _ in range(warmup):
+            measure(client, method, factory, counter)
+
+        latencies, statements, statuses = [], [], set()
+        for _ in range(iterations):
+            if cold:
+                cache.clear()
+            latency, count, status = measure(client, method, factory, counter)
+            latencies.append(latency)
+            statements.append(count)
+            statuses.add(status)
+
+        # Peak memory is sampled in a separate pass since tracing slows every allocation
+        tracemalloc.start()
+        peak = 0
+        for _ in range(min(iterations, 5)):
+            tracemalloc.reset_peak()
+            measure(client, method, factory, counter)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        results[name] = {
+            'p50_ms': round(statistics.median(latencies) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'statements': max(statements),
+            'peak_memory_kb': round(peak / 1024, 1),
+            'status': sorted(statuses)
+        }
+    event.remove(db.engine, 'before_cursor_execute', count_statement)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # Returns the routes that got slower than the tolerance allows, issue more statements, or answer
+    # with other status codes (a route failing fast would otherwise pass as faster)
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if result['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} ms -> {result['p95_ms']} ms")
+        if result['statements'] > previous['statements']:
+            regressions.append(f"{name}: statements {previous['statements']} -> {result['statements']}")
+        if result['status'] != previous['status']:
+            regressions.append(f"{name}: status {previous['status']} -> {result['status']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--iterations', type = int, default = 50)
+    parser.add_argument('--warmup', type = int, default = 5)
+    parser.add_argument('--cold', action = 'store_true', help = 'Clear the page cache before every request.')
+    parser.add_argument('--random-seed', type = int, default = 1)
+    parser.add_argument('--save', metavar = 'PATH', help = 'Write the results as the new baseline.')
+    parser.add_argument('--compare', metavar = 'PATH', help = 'Compare against a saved baseline.')
+    parser.add_argument('--tolerance', type = float, default = 0.2, help = 'Allowed relative p95 growth.')
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        results = run(args.iterations, args.warmup, args.cold, args.random_seed)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    print(f"{'route':<20} {'p50 ms':>9} {'p95 ms':>9} {'stmts':>6} {'peak KB':>9} {'base p95':>9}  status")
+    for name, result in results.items():
+        previous = baseline.get(name, {}).get('p95_ms', '')
+        print(f"{name:<20} {result['p50_ms']:>9} {result['p95_ms']:>9} {result['statements']:>6} "
+              f"{result['peak_memory_kb']:>9} {previous:>9}  {result['status']}")
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent = 2, sort_keys = True)
+
+    if args.compare:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
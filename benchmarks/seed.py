@@ -0,0 +1,169 @@
+"""Seeds a synthetic Fyyur catalogue for benchmarking.
+
+Cities, genres and show bookings follow Zipf-like distributions so a few
+areas, genres and venues dominate, as they do in production data.
+
+    FYYUR_CONFIG=development DATABASE_URL=... python -m benchmarks.seed --venues 50000 --artists 200000 --shows 5000000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from app import create_app, GENRES, area_ids, refresh_area_counts, refresh_show_counts
+from models import db, Venue, Artist, Show
+
+CITIES = [
+    ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('Houston', 'TX'), ('Austin', 'TX'),
+    ('Nashville', 'TN'), ('San Francisco', 'CA'), ('Seattle', 'WA'), ('New Orleans', 'LA'), ('Atlanta', 'GA'),
+    ('Denver', 'CO'), ('Portland', 'OR'), ('Boston', 'MA'), ('Philadelphia', 'PA'), ('Miami', 'FL'),
+    ('Detroit', 'MI'), ('Minneapolis', 'MN'), ('Phoenix', 'AZ'), ('San Diego', 'CA'), ('Dallas', 'TX'),
+    ('Memphis', 'TN'), ('Kansas City', 'MO'), ('Baltimore', 'MD'), ('Pittsburgh', 'PA'), ('Cleveland', 'OH'),
+    ('Salt Lake City', 'UT'), ('Las Vegas', 'NV'), ('Albuquerque', 'NM'), ('Omaha', 'NE'), ('Burlington', 'VT')
+]
+
+WORDS = [
+    'Blue', 'Velvet', 'Electric', 'Midnight', 'Golden', 'Rusty', 'Silver', 'Neon', 'Lonesome', 'Wild',
+    'Crimson', 'Hollow', 'Sonic', 'Brass', 'Echo', 'Lucky', 'Broken', 'Saint', 'Iron', 'Paper'
+]
+VENUE_KINDS = ['Hall', 'Room', 'Lounge', 'Ballroom', 'Tavern', 'Theatre', 'Club', 'Bar', 'Garden', 'Stage']
+ARTIST_KINDS = ['Band', 'Collective', 'Trio', 'Quartet', 'Orchestra', 'Project', 'Brothers', 'Sisters', 'Kids', 'Crew']
+
+
+def zipf_weights(count, exponent = 1.1):
+    # Cumulative weights, so each draw is a bisection instead of a pass over the population
+    return list(accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+def insert_batches(table, rows, batch_size):
+    # Inserting through Core executemany in fixed-size batches to keep memory bounded
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+
+
+def venue_rows(count, areas, rng):
+    city_weights = zipf_weights(len(CITIES))
+    genres = list(GENRES.values())
+    genre_weights = zipf_weights(len(genres))
+    for number in range(1, count + 1):
+        city, state = rng.choices(CITIES, cum_weights = city_weights)[0]
+        yield {
+            'name': f'The {rng.choice(WORDS)} {rng.choice(VENUE_KINDS)} {number}',
+            'city': city,
+            'state': state,
+            'area_id': areas[city, state],
+            'address': f'{rng.randint(1, 9999)} {rng.choice(WORDS)} Street',
+            'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}',
+            'image_link': f'https://images.example.com/venues/{number}.jpg',
+            'facebook_link': f'https://www.facebook.com/venue{number}',
+            'genres': sorted(set(rng.choices(genres, cum_weights = genre_weights, k = rng.randint(1, 3)))),
+            'website': f'https://venue{number}.example.com',
+            'seeking_talent': rng.random() < 0.3,
+            'seeking_description': 'Looking for local acts on weekends.'
+        }
+
+
+def artist_rows(count, areas, rng):
+    city_weights = zipf_weights(len(CITIES))
+    genres = list(GENRES.values())
+    genre_weights = zipf_weights(len(genres))
+    for number in range(1, count + 1):
+        city, state = rng.choices(CITIES, cum_weights = city_weights)[0]
+        yield {
+            'name': f'{rng.choice(WORDS)} {rng.choice(WORDS)} {rng.choice(ARTIST_KINDS)} {number}',
+            'city': city,
+            'state': state,
+            'area_id': areas[city, state],
+            'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}',
+            'image_link': f'https://images.example.com/artists/{number}.jpg',
+            'facebook_link': f'https://www.facebook.com/artist{number}',
+            'genres': sorted(set(rng.choices(genres, cum_weights = genre_weights, k = rng.randint(1, 2)))),
+            'website': f'https://artist{number}.example.com',
+            'seeking_venue': rng.random() < 0.5,
+            'seeking_description': 'Booking shows for the next season.'
+        }
+
+
+def show_rows(count, venues, artists, rng):
+    # Popular venues and artists book far more shows; two hour shows start on even hours from two
+    # years back to one ahead, redrawn when the venue or the artist is already booked for the slot
+    now = datetime.now().replace(minute = 0, second = 0, microsecond = 0)
+    now -= timedelta(hours = now.hour % 2)
+    venue_weights = zipf_weights(venues, 0.8)
+    artist_weights = zipf_weights(artists, 0.8)
+    venue_ids = list(range(1, venues + 1))
+    artist_ids = list(range(1, artists + 1))
+    rng.shuffle(venue_ids)
+    rng.shuffle(artist_ids)
+    venue_slots, artist_slots = set(), set()
+    for _ in range(count):
+        for attempt in range(100):
+            venue_id = rng.choices(venue_ids, cum_weights = venue_weights)[0]
+            artist_id = rng.choices(artist_ids, cum_weights = artist_weights)[0]
+            slot = rng.randint(-365 * 12, 365 * 6)
+            if (venue_id, slot) not in venue_slots and (artist_id, slot) not in artist_slots:
+                break
+        else:
+            continue
+        venue_slots.add((venue_id, slot))
+        artist_slots.add((artist_id, slot))
+        start_time = now + timedelta(hours = 2 * slot)
+        yield {
+            'venue_id': venue_id,
+            'artist_id': artist_id,
+            'start_time': start_time,
+            'end_time': start_time + timedelta(hours = 2)
+        }
+
+
+def seed(venues, artists, shows, batch_size = 10000, random_seed = 1):
+    # Rebuilds the schema and loads a fresh catalogue, returning the seconds spent per table
+    rng = random.Random(random_seed)
+    db.drop_all()
+    db.create_all()
+    areas = area_ids(db.session.connection(), CITIES)
+    db.session.commit()
+
+    timings = {}
+    for table, rows in ((Venue.__table__, venue_rows(venues, areas, rng)),
+                        (Artist.__table__, artist_rows(artists, areas, rng)),
+                        (Show.__table__, show_rows(shows, venues, artists, rng))):
+        start = time.perf_counter()
+        insert_batches(table, rows, batch_size)
+        timings[table.name] = time.perf_counter() - start
+
+    # Bulk inserts bypass the ORM events that maintain the show and area counters
+    now = datetime.now()
+    refresh_show_counts(Venue, now)
+    refresh_show_counts(Artist, now)
+    refresh_area_counts()
+    db.session.commit()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--venues', type = int, default = 5000)
+    parser.add_argument('--artists', type = int, default = 20000)
+    parser.add_argument('--shows', type = int, default = 500000)
+    parser.add_argument('--batch-size', type = int, default = 10000)
+    parser.add_argument('--random-seed', type = int, default = 1)
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        timings = seed(args.venues, args.artists, args.shows, args.batch_size, args.random_seed)
+    for table, seconds in timings.items():
+        print(f'{table:<8} {seconds:8.1f}s')
+
+
+if __name__ == '__main__':
+    main()
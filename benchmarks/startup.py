@@ -0,0 +1,68 @@
+"""Measures how long a fresh process takes to import the app, build it and serve its first page.
+
+Each run starts a new interpreter, so nothing is shared with earlier runs
+beyond the operating system's file cache. With --modules the slowest imports
+of the last run are listed, from python -X importtime.
+
+    python -m benchmarks.startup --runs 10 --modules 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = '''
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+client = application.test_client()
+client.get('/')
+served = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported, 'first_request': served - created}))
+'''
+
+
+def probe(env, importtime = False):
+    # Runs the probe in a new interpreter; returns its timings and its -X importtime report
+    command = [sys.executable, *(['-X', 'importtime'] if importtime else []), '-c', PROBE]
+    result = subprocess.run(command, env = env, capture_output = True, text = True, check = True)
+    return json.loads(result.stdout.splitlines()[-1]), result.stderr
+
+
+def slowest_imports(report, count):
+    # Top-level imports of the report by cumulative microseconds
+    imports = []
+    for line in report.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if name.startswith('   ') and not name.startswith('    '):
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse = True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--runs', type = int, default = 10)
+    parser.add_argument('--modules', type = int, default = 0, help = 'List this many of the slowest imports.')
+    args = parser.parse_args()
+
+    env = dict(os.environ, SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', 'false'))
+    runs = [probe(env)[0] for _ in range(args.runs)]
+    for phase in ('import', 'create_app', 'first_request'):
+        samples = [run[phase] * 1000 for run in runs]
+        print(f'{phase:<14} median {statistics.median(samples):7.1f} ms  min {min(samples):7.1f} ms')
+
+    if args.modules:
+        _, report = probe(env, importtime = True)
+        for cumulative, name in slowest_imports(report, args.modules):
+            print(f'{cumulative / 1000:8.1f} ms  {name}')
+
+
+if __name__ == '__main__':
+    main()
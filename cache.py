@@ -0,0 +1,119 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """In-process cache bounded by entry count, with a TTL per entry."""
+
+    def __init__(self, max_entries = 1024, default_ttl = 300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl = None):
+        expires_at = time.monotonic() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last = False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class RedisCache:
+    """Cache shared by every worker through a Redis-compatible server.
+
+    Entry count and eviction are bounded by the server's own maxmemory
+    policy; its evicted/expired key counters are reported alongside this
+    process's hit and miss counts.
+    """
+
+    def __init__(self, url, default_ttl = 300, prefix = 'fyyur:'):
+        # Imported here so the redis client is only required when this backend is configured
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        payload = self.client.get(self.prefix + key)
+        if payload is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(payload)
+
+    def set(self, key, value, ttl = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self.client.set(self.prefix + key, pickle.dumps(value), px = max(int(ttl * 1000), 1))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+    def stats(self):
+        server = self.client.info('stats')
+        return {
+            'backend': 'redis',
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': server.get('evicted_keys'),
+            'expirations': server.get('expired_keys')
+        }
+
+
+def make_cache(config):
+    # Builds the cache backend selected by CACHE_BACKEND ('memory' or 'redis')
+    if config.get('CACHE_BACKEND') == 'redis':
+        return RedisCache(config['CACHE_REDIS_URL'], default_ttl = config['CACHE_DEFAULT_TTL'])
+    return LRUCache(max_entries = config['CACHE_MAX_ENTRIES'], default_ttl = config['CACHE_DEFAULT_TTL'])
@@ -1,13 +1,148 @@
 import os
-SECRET_KEY = os.urandom(32)
+from pooling import TimedQueuePool
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
 
-# Connect to the database
+def database_uri(default):
+    # Reads DATABASE_URL, accepting the legacy postgres:// scheme that SQLAlchemy no longer does
+    uri = os.environ.get('DATABASE_URL', default)
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
 
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgres://dkhundley@localhost:5432/fyyur'
+def engine_options(uri, pool_size, max_overflow, pool_timeout, pool_recycle, statement_timeout, server_side_cursors = False):
+    # Engine / pool settings for a profile; each can be overridden through a DATABASE_* variable
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': int(os.environ.get('DATABASE_POOL_SIZE', pool_size)),
+        'max_overflow': int(os.environ.get('DATABASE_MAX_OVERFLOW', max_overflow)),
+        'pool_timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', pool_timeout)),
+        'pool_recycle': int(os.environ.get('DATABASE_POOL_RECYCLE', pool_recycle)),
+        'pool_pre_ping': True,
+        'slow_checkout': float(os.environ.get('DATABASE_SLOW_CHECKOUT', 0.1))
+    }
+
+    # Statement timeout in milliseconds, enforced by the Postgres server for every session
+    statement_timeout = int(os.environ.get('DATABASE_STATEMENT_TIMEOUT', statement_timeout))
+    if statement_timeout and uri.startswith('postgresql'):
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+
+    # Streams every result set through a server-side cursor instead of buffering it client-side
+    if os.environ.get('DATABASE_SERVER_SIDE_CURSORS', str(server_side_cursors)).lower() in ('1', 'true', 'yes'):
+        options['execution_options'] = {'stream_results': True}
+
+    return options
+
+
+class Config:
+    # Signs sessions, flashed messages and CSRF tokens, so every worker and every restart must
+    # share it; create_app() refuses to start without one
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+
+    # Enable debug mode.
+    DEBUG = False
+    TESTING = False
+
+    # Connect to the database
+    SQLALCHEMY_DATABASE_URI = database_uri('postgresql://dkhundley@localhost:5432/fyyur')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+
+    # Read replicas (comma-separated DATABASE_REPLICA_URLS) serving the SELECTs of GET requests.
+    # A replica failing a connection is skipped for REPLICA_CHECK_INTERVAL seconds, and a client
+    # reads from the primary for REPLICA_READ_YOUR_WRITES seconds after each write it makes.
+    SQLALCHEMY_REPLICA_URIS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 5))
+    REPLICA_READ_YOUR_WRITES = float(os.environ.get('REPLICA_READ_YOUR_WRITES', 5))
+
+    # Default and maximum number of rows per page of the /venues, /artists and /shows listings
+    PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 200
+
+    # Venues listed under each area of /venues; the rest are on the area's own page
+    VENUES_PER_AREA = 10
+
+    # Number of ranked results shown per page of venue / artist search
+    SEARCH_RESULTS_PER_PAGE = 20
+
+    # Deployed version, mixed into page ETags so that a release changing the markup is not answered with 304s
+    RELEASE = os.environ.get('RELEASE', '')
+
+    # Length of a show booked without an end time, in minutes
+    SHOW_DEFAULT_DURATION = 120
+
+    # Most shows one bulk scheduling request may book, recurrences expanded
+    MAX_BULK_SHOWS = 1000
+
+    # Rows fetched from the database per batch while streaming an export
+    EXPORT_BATCH_SIZE = 1000
+
+    # Detail page cache: 'memory' (per-process LRU, so a write only invalidates the process that
+    # made it) or 'redis' (shared through CACHE_REDIS_URL)
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_DEFAULT_TTL = 300
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+
+    # Seconds a page of /api/v1/venues/available is served from the cache
+    AVAILABILITY_CACHE_TTL = 30
+
+    # Seconds the genre counts of the /venues, /artists and area pages are served from the cache
+    FACET_CACHE_TTL = 60
+
+    # Per-request SQL accounting: warns when a request issues more than SQL_STATEMENT_BUDGET
+    # statements or repeats one SQL_REPEAT_THRESHOLD times, and adds a Server-Timing header
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
+    SQL_STATEMENT_BUDGET = int(os.environ.get('SQL_STATEMENT_BUDGET', 10))
+    SQL_REPEAT_THRESHOLD = int(os.environ.get('SQL_REPEAT_THRESHOLD', 5))
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'development-only-not-secret')
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', 'true').lower() in ('1', 'true', 'yes')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(
+        Config.SQLALCHEMY_DATABASE_URI,
+        pool_size = 5,
+        max_overflow = 5,
+        pool_timeout = 10,
+        pool_recycle = 1800,
+        statement_timeout = 0
+    )
+
+
+class TestConfig(Config):
+    TESTING = True
+    SECRET_KEY = 'test-only-not-secret'
+    WTF_CSRF_ENABLED = False
+
+    # In-memory SQLite; Flask-SQLAlchemy shares its single connection through a StaticPool
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    SQLALCHEMY_REPLICA_URIS = []
+    CACHE_BACKEND = 'memory'
+
+
+class ProductionConfig(Config):
+    # Every worker, and every flask import run, has its own memory cache, and a write only clears
+    # the one of the process that made it; production shares one cache through Redis instead
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'redis')
+
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(
+        Config.SQLALCHEMY_DATABASE_URI,
+        pool_size = 10,
+        max_overflow = 20,
+        pool_timeout = 5,
+        pool_recycle = 600,
+        statement_timeout = 15000
+    )
+
+
+# Profiles selectable through the FYYUR_CONFIG environment variable
+profiles = {
+    'development': DevelopmentConfig,
+    'test': TestConfig,
+    'production': ProductionConfig
+}
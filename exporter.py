@@ -0,0 +1,44 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+# Export formats and the media type each is served with
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson'
+}
+
+
+def export_value(value):
+    # Spells values the way 'flask import' reads them back: datetimes in the form's format,
+    # and, in CSV cells, lists comma-separated
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def csv_lines(result):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(result.keys())
+    yield buffer.getvalue()
+
+    for partition in result.partitions():
+        buffer.seek(0)
+        buffer.truncate()
+        for row in partition:
+            writer.writerow([','.join(value) if isinstance(value, list) else export_value(value) for value in row])
+        yield buffer.getvalue()
+
+
+def jsonl_lines(result):
+    columns = list(result.keys())
+    for partition in result.partitions():
+        yield ''.join(json.dumps(dict(zip(columns, map(export_value, row)))) + '\n' for row in partition)
+
+
+def export_lines(result, format):
+    # Renders a result as CSV or JSON lines, one string per partition fetched from the
+    # database, so only one partition of rows is held in memory at a time
+    return csv_lines(result) if format == 'csv' else jsonl_lines(result)
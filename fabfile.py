@@ -1,3 +1,5 @@
+import os
+
 from fabric.api import local, settings, abort
 from fabric.contrib.console import confirm
 
@@ -6,13 +8,23 @@ from fabric.contrib.console import confirm
 
 def test():
     with settings(warn_only=True):
-        result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
-        )
+        result = local("python test_asgi.py -v && python test_replicas.py -v", capture=True)
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
 
 
+def benchmark():
+    # Without a baseline yet, this run records it for the later runs to be compared against
+    if not os.path.exists("benchmarks/baseline.json"):
+        print("No benchmarks/baseline.json yet: saving this run as the baseline.")
+        local("python -m benchmarks.run --save benchmarks/baseline.json")
+        return
+    with settings(warn_only=True):
+        result = local("python -m benchmarks.run --compare benchmarks/baseline.json")
+    if result.failed and not confirm("Benchmarks regressed. Continue?"):
+        abort("Aborted at user request.")
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
@@ -24,6 +36,7 @@ def push():
 
 def prepare():
     test()
+    benchmark()
     commit()
     push()
 
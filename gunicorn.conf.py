@@ -0,0 +1,33 @@
+"""Gunicorn settings for serving the Flask app:
+
+    SECRET_KEY=... FYYUR_CONFIG=production gunicorn --config gunicorn.conf.py
+
+The app is built once in the master and forked into the workers, which then
+share its code and data copy-on-write instead of each importing and building
+it again.
+"""
+import gc
+import multiprocessing
+import os
+
+wsgi_app = 'app:create_app()'
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+
+
+def when_ready(server):
+    # The worker count is only final here, after the command line (e.g. --workers) overrode this file
+    from app import check_workers
+    check_workers(server.app.wsgi(), server.cfg.workers)
+
+    # Moving everything the master has allocated out of the garbage collector's sight, so that
+    # collections in the workers do not touch (and so copy) the pages they share with it
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # A connection opened in the master would be shared by every worker; each drops the pools
+    # it inherited and opens its own
+    from app import dispose_engines
+    dispose_engines(worker.app.wsgi())
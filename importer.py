@@ -0,0 +1,101 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from werkzeug.datastructures import MultiDict
+
+
+def read_records(path):
+    # Yields (line number, record) pairs from a .csv or .jsonl file, reading one line at a time
+    if path.endswith('.csv'):
+        with open(path, newline = '') as records:
+            reader = csv.DictReader(records)
+            for record in reader:
+                yield reader.line_num, record
+    elif path.endswith(('.jsonl', '.ndjson')):
+        with open(path) as records:
+            for line_number, line in enumerate(records, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as error:
+                    raise ValueError(f'{path}:{line_number}: {error}')
+    else:
+        raise ValueError(f'{path}: expected a .csv or .jsonl file')
+
+
+def chunked(iterable, size):
+    # Splits an iterable into lists of at most size items without materialising it
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def to_bool(value):
+    # Reads the booleans CSV and JSON files spell in different ways
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in ('1', 't', 'true', 'y', 'yes')
+
+
+def validate(form, record):
+    # Runs a record through a web form's fields and validators, returning (data, errors).
+    # Every field is submitted, so a missing value fails validation instead of taking the
+    # field's default; list values and comma-separated CSV cells fill multi-select fields.
+    formdata = MultiDict()
+    for field in form:
+        value = record.get(field.name)
+        if isinstance(value, list):
+            formdata.setlist(field.name, [str(item) for item in value])
+        elif field.type == 'SelectMultipleField':
+            formdata.setlist(field.name, [item.strip() for item in str(value or '').split(',') if item.strip()])
+        else:
+            formdata[field.name] = '' if value is None else str(value)
+
+    form.process(formdata)
+    if form.validate():
+        return form.data, {}
+    return None, form.errors
+
+
+def copy_value(value):
+    # Renders a value in COPY's text format, where \N is NULL; lists become array literals
+    if value is None:
+        return '\\N'
+    if isinstance(value, (list, tuple)):
+        value = '{' + ','.join('"{}"'.format(str(item).replace('\\', '\\\\').replace('"', '\\"')) for item in value) + '}'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def load_rows(connection, table, rows):
+    # Inserts a chunk of row dicts sharing the same keys: through COPY on Postgres,
+    # as a single executemany everywhere else
+    if connection.dialect.name != 'postgresql':
+        connection.execute(table.insert(), rows)
+        return
+
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(copy_value(row[column]) for column in columns) + '\n')
+
+    preparer = connection.dialect.identifier_preparer
+    statement = 'COPY {} ({}) FROM STDIN'.format(
+        preparer.format_table(table), ', '.join(preparer.quote(column) for column in columns))
+
+    # COPY runs on the DBAPI connection underneath the session, inside its transaction
+    cursor = connection.connection.cursor()
+    try:
+        if hasattr(cursor, 'copy_expert'):
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+        else:
+            with cursor.copy(statement) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
@@ -0,0 +1,93 @@
+import time
+from collections import Counter
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class RequestStats:
+    """Statements issued while serving one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.fingerprints[statement] += 1
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info['query_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    start = connection.info.pop('query_start')
+    # Statements outside an instrumented request (CLI commands, startup) are not accounted for
+    stats = g.get('sql_stats') if has_app_context() else None
+    if stats is not None:
+        stats.record(statement, time.perf_counter() - start)
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute, so its start is dropped here
+    if context.connection is not None:
+        context.connection.info.pop('query_start', None)
+
+
+def listen_once(target, identifier, listener):
+    if not event.contains(target, identifier, listener):
+        event.listen(target, identifier, listener)
+
+
+class SQLInstrumentation:
+    """Counts and times the SQL each request issues, warning about budget overruns and N+1 patterns.
+
+    Nothing is registered unless SQL_INSTRUMENTATION is enabled, so a disabled
+    instance costs nothing per statement or per request. Listeners attach to
+    every Engine, so statements routed to any database are accounted for. They
+    are registered once per process however many apps are built, and record
+    into the current request's stats, which only instrumented apps start.
+    """
+
+    def __init__(self, app = None):
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('SQL_INSTRUMENTATION'):
+            return
+        self.enabled = True
+        self.app = app
+        self.statement_budget = app.config['SQL_STATEMENT_BUDGET']
+        self.repeat_threshold = app.config['SQL_REPEAT_THRESHOLD']
+
+        listen_once(Engine, 'before_cursor_execute', _before_cursor_execute)
+        listen_once(Engine, 'after_cursor_execute', _after_cursor_execute)
+        listen_once(Engine, 'handle_error', _handle_error)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def _start_request(self):
+        g.sql_stats = RequestStats()
+
+    def _finish_request(self, response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+
+        route = request.url_rule.rule if request.url_rule else request.path
+        if stats.count > self.statement_budget:
+            self.app.logger.warning('%s %s issued %d SQL statements (budget %d) in %.1f ms',
+                request.method, route, stats.count, self.statement_budget, stats.duration * 1000)
+        for statement, repeats in stats.fingerprints.items():
+            if repeats >= self.repeat_threshold:
+                self.app.logger.warning('%s %s repeated the same statement %d times (possible N+1): %s',
+                    request.method, route, repeats, ' '.join(statement.split())[:200])
+
+        response.headers.add('Server-Timing', f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"')
+        return response
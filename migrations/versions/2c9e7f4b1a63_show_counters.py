@@ -0,0 +1,36 @@
+"""show counters
+
+Revision ID: 2c9e7f4b1a63
+Revises: 8d3f6c1a2e90
+Create Date: 2026-10-18 12:40:05.912270
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c9e7f4b1a63'
+down_revision = '8d3f6c1a2e90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfilling the counters from the existing shows
+    for table in ('venue', 'artist'):
+        op.execute(f"""
+            UPDATE {table} SET
+                upcoming_shows_count = (SELECT count(*) FROM show WHERE show.{table}_id = {table}.id AND show.start_time > CURRENT_TIMESTAMP),
+                past_shows_count = (SELECT count(*) FROM show WHERE show.{table}_id = {table}.id AND show.start_time <= CURRENT_TIMESTAMP)
+        """)
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
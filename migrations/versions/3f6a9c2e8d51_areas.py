@@ -0,0 +1,71 @@
+"""areas
+
+Revision ID: 3f6a9c2e8d51
+Revises: 5e8b2d4f7a16
+Create Date: 2026-10-18 19:07:12.604391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6a9c2e8d51'
+down_revision = '5e8b2d4f7a16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    op.create_table('area',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('venue_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('artist_count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('state', 'city', name='uq_area_state_city')
+    )
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('area_id', sa.Integer(), nullable=True))
+        # SQLite cannot add a foreign key to an existing table; the application keeps area_id valid there
+        if postgresql:
+            op.create_foreign_key(f'{table}_area_id_fkey', table, 'area', ['area_id'], ['id'])
+
+    # One area per distinct city / state pair, spelled the way the application normalises them
+    op.execute("""
+        INSERT INTO area (city, state)
+        SELECT DISTINCT trim(city), upper(trim(state)) FROM (
+            SELECT city, state FROM venue UNION SELECT city, state FROM artist
+        ) AS places
+        WHERE trim(city) <> '' AND trim(state) <> ''
+    """)
+    for table in ('venue', 'artist'):
+        op.execute(f"""
+            UPDATE {table} SET area_id = (
+                SELECT area.id FROM area
+                WHERE area.city = trim({table}.city) AND area.state = upper(trim({table}.state))
+            )
+        """)
+    op.execute("""
+        UPDATE area SET
+            venue_count = (SELECT count(*) FROM venue WHERE venue.area_id = area.id),
+            artist_count = (SELECT count(*) FROM artist WHERE artist.area_id = area.id)
+    """)
+
+    with op.get_context().autocommit_block():
+        for table in ('venue', 'artist'):
+            op.create_index(f'ix_{table}_area_id', table, ['area_id', 'id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in ('artist', 'venue'):
+            op.drop_index(f'ix_{table}_area_id', table_name=table, postgresql_concurrently=True)
+
+    for table in ('artist', 'venue'):
+        if op.get_bind().dialect.name == 'postgresql':
+            op.drop_constraint(f'{table}_area_id_fkey', table, type_='foreignkey')
+        op.drop_column(table, 'area_id')
+    op.drop_table('area')
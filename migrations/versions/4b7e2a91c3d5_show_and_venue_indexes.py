@@ -0,0 +1,32 @@
+"""show and venue indexes
+
+Revision ID: 4b7e2a91c3d5
+Revises: dc2cfad4b40d
+Create Date: 2026-10-18 09:12:44.310522
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7e2a91c3d5'
+down_revision = 'dc2cfad4b40d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block, so the
+    # indexes are built in autocommit mode to avoid locking the tables on Postgres
+    with op.get_context().autocommit_block():
+        op.create_index('ix_show_venue_id_start_time', 'show', ['venue_id', 'start_time'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_show_artist_id_start_time', 'show', ['artist_id', 'start_time'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_venue_state_city', 'venue', ['state', 'city'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_venue_state_city', table_name='venue', postgresql_concurrently=True)
+        op.drop_index('ix_show_artist_id_start_time', table_name='show', postgresql_concurrently=True)
+        op.drop_index('ix_show_venue_id_start_time', table_name='show', postgresql_concurrently=True)
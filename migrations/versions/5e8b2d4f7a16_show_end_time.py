@@ -0,0 +1,58 @@
+"""show end_time
+
+Revision ID: 5e8b2d4f7a16
+Revises: 7a1d5e3c9b24
+Create Date: 2026-10-18 16:21:48.330517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8b2d4f7a16'
+down_revision = '7a1d5e3c9b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    op.add_column('show', sa.Column('end_time', sa.DateTime(), nullable=True))
+
+    # Existing shows last two hours, cut short by the next show of their venue or artist so that
+    # earlier double bookings do not violate the constraints (duplicates end up zero-length)
+    if postgresql:
+        op.execute("UPDATE show SET end_time = start_time + interval '2 hours'")
+    else:
+        op.execute("UPDATE show SET end_time = datetime(start_time, '+2 hours')")
+    for column in ('venue_id', 'artist_id'):
+        op.execute(f"""
+            UPDATE show SET end_time = (
+                SELECT min(later.start_time) FROM show later
+                WHERE later.{column} = show.{column} AND later.id <> show.id
+                  AND later.start_time >= show.start_time AND later.start_time < show.end_time
+            )
+            WHERE EXISTS (
+                SELECT 1 FROM show later
+                WHERE later.{column} = show.{column} AND later.id <> show.id
+                  AND later.start_time >= show.start_time AND later.start_time < show.end_time
+            )
+        """)
+
+    # SQLite cannot tighten the column in place; the application always sets it there
+    if postgresql:
+        op.alter_column('show', 'end_time', nullable=False)
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        for column in ('venue_id', 'artist_id'):
+            op.execute(f"""
+                ALTER TABLE show ADD CONSTRAINT show_{column.split('_')[0]}_booking_excl
+                EXCLUDE USING gist ({column} WITH =, tsrange(start_time, end_time) WITH &&)
+            """)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_constraint('show_artist_booking_excl', 'show')
+        op.drop_constraint('show_venue_booking_excl', 'show')
+    op.drop_column('show', 'end_time')
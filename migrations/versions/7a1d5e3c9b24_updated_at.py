@@ -0,0 +1,43 @@
+"""updated_at
+
+Revision ID: 7a1d5e3c9b24
+Revises: 2c9e7f4b1a63
+Create Date: 2026-10-18 14:02:37.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a1d5e3c9b24'
+down_revision = '2c9e7f4b1a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venue', 'artist', 'show'):
+        if op.get_bind().dialect.name == 'postgresql':
+            op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+        else:
+            # SQLite cannot add a column with a non-constant default, so existing rows are backfilled
+            # and the table is then recreated with the column NOT NULL and defaulted, as on Postgres
+            op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+            op.execute(f'UPDATE {table} SET updated_at = CURRENT_TIMESTAMP')
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False, server_default=sa.func.now())
+
+    # Indexed so that max(updated_at) is answered from the end of the index
+    with op.get_context().autocommit_block():
+        for table in ('venue', 'artist', 'show'):
+            op.create_index(f'ix_{table}_updated_at', table, ['updated_at'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in ('show', 'artist', 'venue'):
+            op.drop_index(f'ix_{table}_updated_at', table_name=table, postgresql_concurrently=True)
+
+    for table in ('show', 'artist', 'venue'):
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,41 @@
+"""search indexes
+
+Revision ID: 8d3f6c1a2e90
+Revises: 4b7e2a91c3d5
+Create Date: 2026-10-18 11:02:17.448391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d3f6c1a2e90'
+down_revision = '4b7e2a91c3d5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Trigram and array GIN indexes are Postgres-only; SQLite databases get
+    # their FTS5 search tables from db.create_all()
+    if op.get_context().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.get_context().autocommit_block():
+        for table in ('venue', 'artist'):
+            op.create_index(f'ix_{table}_name_trgm', table, ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}, postgresql_concurrently=True)
+            op.create_index(f'ix_{table}_city_trgm', table, ['city'], unique=False, postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'}, postgresql_concurrently=True)
+            op.create_index(f'ix_{table}_genres', table, ['genres'], unique=False, postgresql_using='gin', postgresql_concurrently=True)
+
+
+def downgrade():
+    if op.get_context().dialect.name != 'postgresql':
+        return
+
+    with op.get_context().autocommit_block():
+        for table in ('artist', 'venue'):
+            op.drop_index(f'ix_{table}_genres', table_name=table, postgresql_concurrently=True)
+            op.drop_index(f'ix_{table}_city_trgm', table_name=table, postgresql_concurrently=True)
+            op.drop_index(f'ix_{table}_name_trgm', table_name=table, postgresql_concurrently=True)
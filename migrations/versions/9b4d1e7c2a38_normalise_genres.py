@@ -0,0 +1,57 @@
+"""normalise genres
+
+Revision ID: 9b4d1e7c2a38
+Revises: 3f6a9c2e8d51
+Create Date: 2026-10-18 20:41:05.117832
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4d1e7c2a38'
+down_revision = '3f6a9c2e8d51'
+branch_labels = None
+depends_on = None
+
+# The venue form used to store its genres joined into one comma-separated string. Postgres
+# turned that string into an array of its characters, SQLite kept it as a JSON string.
+BROKEN = {
+    'postgresql': """
+        EXISTS (SELECT 1 FROM unnest(genres) AS genre WHERE genre LIKE '%,%')
+        OR (cardinality(genres) > 1 AND NOT EXISTS (SELECT 1 FROM unnest(genres) AS genre WHERE length(genre) > 1))
+    """,
+    'sqlite': """
+        json_type(genres) = 'text'
+        OR EXISTS (SELECT 1 FROM json_each(genres) WHERE value LIKE '%,%')
+    """
+}
+
+
+def split_genres(genres):
+    # The genre list a broken value stood for
+    if isinstance(genres, str):
+        joined = genres
+    elif all(len(genre) == 1 for genre in genres):
+        joined = ''.join(genres)
+    else:
+        joined = ','.join(genres)
+    return list(dict.fromkeys(genre.strip() for genre in joined.split(',') if genre.strip()))
+
+
+def upgrade():
+    connection = op.get_bind()
+    for name in ('venue', 'artist'):
+        table = sa.table(name, sa.column('id', sa.Integer()),
+                         sa.column('genres', postgresql.ARRAY(sa.String()).with_variant(sa.JSON(), 'sqlite')))
+        rows = connection.execute(sa.select(table.c.id, table.c.genres).where(sa.text(BROKEN[connection.dialect.name]))).all()
+        if rows:
+            connection.execute(table.update().where(table.c.id == sa.bindparam('row_id')).values(genres=sa.bindparam('fixed')),
+                               [{'row_id': row_id, 'fixed': split_genres(genres)} for row_id, genres in rows])
+
+
+def downgrade():
+    # The repaired lists are what the form meant to store; there is nothing to restore
+    pass
@@ -0,0 +1,29 @@
+"""table version
+
+Revision ID: c41f8a2d7b90
+Revises: 9b4d1e7c2a38
+Create Date: 2026-10-18 22:14:52.604193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41f8a2d7b90'
+down_revision = '9b4d1e7c2a38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Deletion counts for the listing validators, which no longer count the venue and artist rows
+    op.create_table('table_version',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('deletions', sa.Integer(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('table_version')
@@ -0,0 +1,132 @@
+from datetime import datetime
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, DDL
+from sqlalchemy.dialects import postgresql
+
+from replicas import RoutingSession
+
+# Committing does not expire the session's objects: each request gets a fresh session, so what a
+# write view just saved stays readable without reloading it
+db = SQLAlchemy(session_options = {'class_': RoutingSession, 'expire_on_commit': False})
+
+class Area(db.Model):
+    __table_args__ = (
+        # Also the index /venues pages through areas with
+        db.UniqueConstraint('state', 'city', name = 'uq_area_state_city'),
+    )
+
+    id = db.Column(db.Integer, primary_key = True)
+    city = db.Column(db.String(120), nullable = False)
+    state = db.Column(db.String(120), nullable = False)
+    venue_count = db.Column(db.Integer, nullable = False, default = 0, server_default = '0')
+    artist_count = db.Column(db.Integer, nullable = False, default = 0, server_default = '0')
+
+    def __repr__(self):
+        return f'<Area {self.id} {self.city}, {self.state}>'
+
+class Venue(db.Model):
+    __table_args__ = (
+        db.Index('ix_venue_state_city', 'state', 'city'),
+        db.Index('ix_venue_area_id', 'area_id', 'id'),
+        db.Index('ix_venue_name_trgm', 'name', postgresql_using = 'gin', postgresql_ops = {'name': 'gin_trgm_ops'}).ddl_if(dialect = 'postgresql'),
+        db.Index('ix_venue_city_trgm', 'city', postgresql_using = 'gin', postgresql_ops = {'city': 'gin_trgm_ops'}).ddl_if(dialect = 'postgresql'),
+        db.Index('ix_venue_genres', 'genres', postgresql_using = 'gin').ddl_if(dialect = 'postgresql'),
+        db.Index('ix_venue_updated_at', 'updated_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key = True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    area_id = db.Column(db.Integer, db.ForeignKey('area.id'))
+    address = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+    genres = db.Column(postgresql.ARRAY(db.String()).with_variant(db.JSON, 'sqlite'))
+    website = db.Column(db.String(200))
+    seeking_talent = db.Column(db.Boolean)
+    seeking_description = db.Column(db.String(500))
+    upcoming_shows_count = db.Column(db.Integer, nullable = False, default = 0, server_default = '0')
+    past_shows_count = db.Column(db.Integer, nullable = False, default = 0, server_default = '0')
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.now, onupdate = datetime.now, server_default = db.func.now())
+    shows = db.relationship('Show', backref = 'venue', lazy = True)
+
+    def __repr__(self):
+        return f'<Venue {self.id} {self.name}>'
+
+    # TODO: implement any missing fields, as a database migration using Flask-Migrate
+
+class Artist(db.Model):
+    __table_args__ = (
+        db.Index('ix_artist_area_id', 'area_id', 'id'),
+        db.Index('ix_artist_name_trgm', 'name', postgresql_using = 'gin', postgresql_ops = {'name': 'gin_trgm_ops'}).ddl_if(dialect = 'postgresql'),
+        db.Index('ix_artist_city_trgm', 'city', postgresql_using = 'gin', postgresql_ops = {'city': 'gin_trgm_ops'}).ddl_if(dialect = 'postgresql'),
+        db.Index('ix_artist_genres', 'genres', postgresql_using = 'gin').ddl_if(dialect = 'postgresql'),
+        db.Index('ix_artist_updated_at', 'updated_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key = True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    area_id = db.Column(db.Integer, db.ForeignKey('area.id'))
+    phone = db.Column(db.String(120))
+    genres = db.Column(db.String(120))
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+    genres = db.Column(postgresql.ARRAY(db.String(120)).with_variant(db.JSON, 'sqlite'))
+    website = db.Column(db.String(200))
+    seeking_venue = db.Column(db.Boolean)
+    seeking_description = db.Column(db.String(500))
+    upcoming_shows_count = db.Column(db.Integer, nullable = False, default = 0, server_default = '0')
+    past_shows_count = db.Column(db.Integer, nullable = False, default = 0, server_default = '0')
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.now, onupdate = datetime.now, server_default = db.func.now())
+    shows = db.relationship('Show', backref = 'artist', lazy = True)
+
+    def __repr__(self):
+        return f'<Artist {self.id} {self.name}>'
+
+
+class Show(db.Model):
+    __table_args__ = (
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_show_updated_at', 'updated_at'),
+        # A venue or artist cannot be booked for two overlapping [start_time, end_time) ranges;
+        # btree_gist lets the id's equality share the GiST index with the range overlap
+        postgresql.ExcludeConstraint(
+          ('venue_id', '='), (db.func.tsrange(db.column('start_time'), db.column('end_time')), '&&'),
+          name = 'show_venue_booking_excl', using = 'gist').ddl_if(dialect = 'postgresql'),
+        postgresql.ExcludeConstraint(
+          ('artist_id', '='), (db.func.tsrange(db.column('start_time'), db.column('end_time')), '&&'),
+          name = 'show_artist_booking_excl', using = 'gist').ddl_if(dialect = 'postgresql'),
+    )
+
+    id = db.Column(db.Integer, primary_key = True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('artist.id'), nullable = False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), nullable = False)
+    start_time = db.Column(db.DateTime, nullable = False)
+    end_time = db.Column(db.DateTime, nullable = False)
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.now, onupdate = datetime.now, server_default = db.func.now())
+
+    def __repr__(self):
+        return f'<Show {self.id}>'
+
+class TableVersion(db.Model):
+    # Counts the deletions from a table, which its max(updated_at) cannot show, so that listing
+    # validators notice them with a primary key lookup instead of counting the table's rows
+    __tablename__ = 'table_version'
+
+    name = db.Column(db.String(64), primary_key = True)
+    deletions = db.Column(db.Integer, nullable = False, default = 0, server_default = '0')
+
+    def __repr__(self):
+        return f'<TableVersion {self.name} {self.deletions}>'
+
+event.listen(Show.__table__, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect = 'postgresql'))
+
+# Setting up the backrefs (Show.venue, Show.artist) now rather than on the first query,
+# so that statements can be built from them before anything has been queried
+db.configure_mappers()
@@ -0,0 +1,71 @@
+import logging
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """Running totals of how long callers waited to check out a connection."""
+
+    def __init__(self, slow_checkout = 0.1):
+        self.slow_checkout = slow_checkout
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.slow_checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait, timed_out = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            if wait >= self.slow_checkout:
+                self.slow_checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'slow_checkouts': self.slow_checkouts,
+                'total_wait_ms': round(self.total_wait * 1000, 3),
+                'mean_wait_ms': round(self.total_wait * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 3)
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that measures the time spent waiting for a free connection."""
+
+    def __init__(self, creator, slow_checkout = 0.1, **kwargs):
+        super().__init__(creator, **kwargs)
+        self.stats = PoolStats(slow_checkout)
+
+    def recreate(self):
+        # Keeping the counters across dispose() / fork, which rebuild the pool object
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record(time.perf_counter() - start, timed_out = True)
+            logger.warning('Timed out waiting for a database connection (%s)', self.status())
+            raise
+        wait = time.perf_counter() - start
+        self.stats.record(wait)
+        if wait >= self.stats.slow_checkout:
+            logger.warning('Waited %.1f ms for a database connection (%s)', wait * 1000, self.status())
+        return connection
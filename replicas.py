@@ -0,0 +1,185 @@
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, exc
+
+logger = logging.getLogger(__name__)
+
+# Requests that never write, and so may read from a replica
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def read_only_request():
+    # A GET / HEAD request, or one served by a view marked read_only
+    return request.method in SAFE_METHODS or g.get('read_only', False)
+
+
+class ReplicaSet:
+    """Read replica engines, handed out round-robin while they pass their health checks.
+
+    A replica whose connection fails is taken out of rotation for
+    REPLICA_CHECK_INTERVAL seconds, after which it is pinged before it is used
+    again, and the read-only request that hit the failure is served again from
+    the primary. With no replica configured, or none healthy, reads stay on the
+    primary.
+    """
+
+    def __init__(self, app = None):
+        self.engines = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+        self.engines = [create_engine(url, **options) for url in app.config['SQLALCHEMY_REPLICA_URIS']]
+        self.check_interval = app.config['REPLICA_CHECK_INTERVAL']
+        self.read_your_writes = app.config['REPLICA_READ_YOUR_WRITES']
+        self._cycle = itertools.cycle(self.engines)
+        self._lock = threading.Lock()
+        self._down_until = {}
+        self.reads = {engine: 0 for engine in self.engines}
+        self.failures = {engine: 0 for engine in self.engines}
+
+        for engine in self.engines:
+            event.listen(engine, 'handle_error', self._handle_error)
+        app.extensions['replicas'] = self
+        app.before_request(self._forget_replica)
+        app.after_request(self._remember_write)
+        app.register_error_handler(exc.DBAPIError, self._retry_on_primary)
+
+    def choose(self):
+        # The next healthy replica, or None to read from the primary
+        for _ in range(len(self.engines)):
+            with self._lock:
+                engine = next(self._cycle)
+                down_until = self._down_until.get(engine)
+                if down_until is not None:
+                    if down_until > time.monotonic():
+                        continue
+                    # Keeping other requests off the replica while this one checks it
+                    self._down_until[engine] = time.monotonic() + self.check_interval
+            if down_until is not None and not self._ping(engine):
+                continue
+            with self._lock:
+                self._down_until.pop(engine, None)
+                self.reads[engine] += 1
+            return engine
+        return None
+
+    def _ping(self, engine):
+        try:
+            with engine.connect() as connection:
+                connection.exec_driver_sql('SELECT 1')
+        except Exception:
+            return False
+        logger.info('Replica %s is back in rotation', engine.url.render_as_string())
+        return True
+
+    def _handle_error(self, context):
+        # Taking a replica out of rotation when it cannot be reached
+        if context.is_disconnect or context.connection is None:
+            engine = context.engine
+            with self._lock:
+                self._down_until[engine] = time.monotonic() + self.check_interval
+                self.failures[engine] += 1
+            logger.warning('Replica %s is unreachable, reading from the others: %s',
+                           engine.url.render_as_string(), context.original_exception)
+            if has_app_context():
+                g.replica_failed = True
+
+    def _retry_on_primary(self, error):
+        # Read-only requests are safe to repeat, so one failing on a replica is served again
+        # from the primary; any other database error goes on to the usual error handling
+        if not (g.pop('replica_failed', False) and read_only_request()):
+            raise error
+        current_app.extensions['sqlalchemy'].session.rollback()
+        g.pop('replica', None)
+        with primary():
+            return current_app.view_functions[request.endpoint](**request.view_args)
+
+    def _forget_replica(self):
+        # Each request picks its own replica, even when requests share an app context (test clients)
+        g.pop('replica', None)
+
+    def _remember_write(self, response):
+        # A client that just wrote reads from the primary for a while, so it sees its own writes
+        # before they reach the replicas
+        if self.engines and not read_only_request():
+            session['read_primary_until'] = time.time() + self.read_your_writes
+        return response
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                'url': engine.url.render_as_string(),
+                'healthy': self._down_until.get(engine, 0) <= now,
+                'reads': self.reads[engine],
+                'failures': self.failures[engine]
+            } for engine in self.engines]
+
+
+def reads_from_replica():
+    # Whether the current request may read from a replica: a read-only request, from a client
+    # that has not written recently, that neither it (X-Read-From: primary) nor the code
+    # serving it (primary()) asked for the primary
+    return has_request_context() \
+        and read_only_request() \
+        and not g.get('read_primary', False) \
+        and request.headers.get('X-Read-From', '').lower() != 'primary' \
+        and session.get('read_primary_until', 0) <= time.time()
+
+
+class RoutingSession(Session):
+    """Session sending the SELECTs of read-only requests to a replica and everything else to the primary.
+
+    The replica is chosen on a request's first SELECT and kept for the rest of
+    it, so all its reads see one replica's state (a page and its validators
+    cannot disagree through different lags) over a single connection.
+    """
+
+    def get_bind(self, mapper = None, clause = None, bind = None, **kwargs):
+        replicas = current_app.extensions.get('replicas') if bind is None else None
+        if replicas is not None and replicas.engines and not self._flushing \
+                and getattr(clause, 'is_select', False) and reads_from_replica():
+            if 'replica' not in g:
+                g.replica = replicas.choose()
+            if g.replica is not None:
+                return g.replica
+        return super().get_bind(mapper, clause, bind, **kwargs)
+
+
+@contextmanager
+def primary():
+    # Reads from the primary within the block
+    previous = g.get('read_primary', False)
+    g.read_primary = True
+    try:
+        yield
+    finally:
+        g.read_primary = previous
+
+
+def read_only(view):
+    # Marks a view answering another method than GET / HEAD (e.g. a search form's POST) as never
+    # writing, so that it reads from a replica
+    @wraps(view)
+    def read_only_view(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return read_only_view
+
+
+def reads_primary(view):
+    # Serves a view from the primary only, e.g. forms about to be submitted as writes
+    @wraps(view)
+    def primary_view(*args, **kwargs):
+        with primary():
+            return view(*args, **kwargs)
+    return primary_view
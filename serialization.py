@@ -0,0 +1,21 @@
+import json
+from datetime import date
+
+# orjson is optional; the standard library encoder produces the same output, only slower
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(data):
+    # Encodes data as compact JSON bytes, with dates and datetimes in ISO 8601
+    if orjson is not None:
+        return orjson.dumps(data, default = json_default)
+    return json.dumps(data, separators = (',', ':'), ensure_ascii = False, default = json_default).encode()
@@ -0,0 +1,82 @@
+"""Smoke test fetching every page served by the async app in asgi.py.
+
+Runs against a seeded SQLite file, so it needs quart and aiosqlite on top of
+requirements.txt (and is skipped without them):
+
+    pip install quart hypercorn aiosqlite
+    python test_asgi.py -v
+"""
+import importlib.util
+import os
+import tempfile
+import unittest
+
+ASYNC_REQUIREMENTS = ('quart', 'hypercorn', 'aiosqlite', 'greenlet')
+
+
+@unittest.skipUnless(all(importlib.util.find_spec(module) for module in ASYNC_REQUIREMENTS),
+                     'needs ' + ', '.join(ASYNC_REQUIREMENTS))
+class AsyncPagesTest(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # asgi.py builds its app on import, so the database is chosen before importing it
+        cls.directory = tempfile.TemporaryDirectory()
+        os.environ.update({
+            'FYYUR_CONFIG': 'development',
+            'DATABASE_URL': 'sqlite:///' + os.path.join(cls.directory.name, 'fyyur.db'),
+            'DATABASE_REPLICA_URLS': '',
+            'SQL_INSTRUMENTATION': 'false'
+        })
+        from benchmarks.seed import seed
+        import asgi
+
+        with asgi.app.app_context():
+            seed(venues = 20, artists = 20, shows = 100)
+        cls.asgi = asgi
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.asgi.app.app_context():
+            cls.asgi.app.extensions['sqlalchemy'].engine.dispose()
+        cls.directory.cleanup()
+
+    async def asyncSetUp(self):
+        self.client = self.asgi.asgi.test_client()
+
+    async def asyncTearDown(self):
+        await self.asgi.engine.dispose()
+
+    async def assertServes(self, path, status = 200):
+        response = await self.client.get(path)
+        self.assertEqual(response.status_code, status, path)
+        return await response.get_data(as_text = True)
+
+    async def test_pages(self):
+        for path in ('/', '/venues', '/artists', '/shows', '/areas/1', '/venues/1', '/artists/1'):
+            with self.subTest(path = path):
+                await self.assertServes(path)
+
+    async def test_genre_filters(self):
+        for path in ('/venues?genre=Jazz', '/artists?genre=Jazz', '/areas/1?genre=Jazz'):
+            with self.subTest(path = path):
+                await self.assertServes(path)
+
+    async def test_next_page(self):
+        page = await self.assertServes('/artists?limit=5')
+        self.assertIn('after=', page)
+        await self.assertServes('/shows?limit=5')
+
+    async def test_cached_detail_page(self):
+        # The second request is answered from the page cache
+        first = await self.assertServes('/venues/2')
+        self.assertEqual(await self.assertServes('/venues/2'), first)
+
+    async def test_missing(self):
+        for path in ('/areas/9999', '/venues/9999', '/artists/9999'):
+            with self.subTest(path = path):
+                await self.assertServes(path, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""Tests the read replica routing with SQLite files standing in for the primary and its replicas.
+
+The replica files start as copies of the primary, then artist 1 is renamed
+differently in each database, so a page shows which one it was read from:
+
+    python test_replicas.py -v
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+# Statement counting is not what these tests are about
+os.environ.setdefault('SQL_INSTRUMENTATION', 'false')
+
+import config
+from app import create_app
+from models import db, Artist
+
+
+class ReplicaRoutingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.primary = self.path('primary.db')
+        self.replicas = [self.path('replica1.db'), self.path('replica2.db')]
+
+        # Building the primary, then the replicas as copies of it
+        app = self.build_app([])
+        with app.app_context():
+            db.create_all()
+            db.session.add(Artist(name = 'Primary Artist', city = 'Austin', state = 'TX'))
+            db.session.commit()
+            db.engine.dispose()
+        for number, replica in enumerate(self.replicas, 1):
+            shutil.copy(self.primary, replica)
+            self.rename_artist(replica, f'Replica {number} Artist')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def rename_artist(self, database, name):
+        with sqlite3.connect(database) as connection:
+            connection.execute('UPDATE artist SET name = ? WHERE id = 1', (name,))
+
+    def build_app(self, replica_paths):
+        class Config(config.TestConfig):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{self.primary}'
+            SQLALCHEMY_REPLICA_URIS = [f'sqlite:///{path}' for path in replica_paths]
+        return create_app(Config)
+
+    def artist_page(self, client, **headers):
+        response = client.get('/artists', headers = headers)
+        self.assertEqual(response.status_code, 200)
+        page = response.get_data(as_text = True)
+        return [name for name in ('Primary Artist', 'Replica 1 Artist', 'Replica 2 Artist') if name in page]
+
+    def test_get_reads_one_replica_per_request(self):
+        app = self.build_app(self.replicas)
+        client = app.test_client()
+        # Round-robin between requests, but each request (validators and page) on one replica
+        self.assertEqual(self.artist_page(client), ['Replica 1 Artist'])
+        self.assertEqual(self.artist_page(client), ['Replica 2 Artist'])
+        self.assertEqual([replica['reads'] for replica in app.extensions['replicas'].stats()], [1, 1])
+
+    def test_post_reads_primary(self):
+        app = self.build_app(self.replicas[:1])
+        with app.test_request_context('/artists/create', method = 'POST'):
+            self.assertEqual(db.session.get_bind(clause = db.select(Artist)).url.database, self.primary)
+        with app.test_request_context('/artists'):
+            self.assertEqual(db.session.get_bind(clause = db.select(Artist)).url.database, self.replicas[0])
+
+    def test_reads_primary_after_write(self):
+        app = self.build_app(self.replicas[:1])
+        client = app.test_client()
+        response = client.post('/artists/create', data = {
+            'name': 'New Artist', 'city': 'Austin', 'state': 'TX', 'phone': '', 'genres': 'Jazz',
+            'website': '', 'facebook_link': '', 'image_link': '', 'seeking_description': ''
+        })
+        self.assertEqual(response.status_code, 200)
+        # Within REPLICA_READ_YOUR_WRITES of its write the client reads the primary
+        self.assertEqual(self.artist_page(client), ['Primary Artist'])
+        with client.session_transaction() as session:
+            session['read_primary_until'] = 0
+        self.assertEqual(self.artist_page(client), ['Replica 1 Artist'])
+
+    def test_read_from_primary_header(self):
+        client = self.build_app(self.replicas[:1]).test_client()
+        self.assertEqual(self.artist_page(client, **{'X-Read-From': 'primary'}), ['Primary Artist'])
+        self.assertEqual(self.artist_page(client), ['Replica 1 Artist'])
+
+    def test_failed_replica_falls_back_to_primary(self):
+        # A replica in a missing directory cannot be opened
+        app = self.build_app([self.path('missing/replica.db')])
+        client = app.test_client()
+        self.assertEqual(self.artist_page(client), ['Primary Artist'])
+        stats, = app.extensions['replicas'].stats()
+        self.assertFalse(stats['healthy'])
+        self.assertEqual(stats['failures'], 1)
+        # Taken out of rotation, so the next request goes straight to the primary
+        self.assertEqual(self.artist_page(client), ['Primary Artist'])
+        self.assertEqual(app.extensions['replicas'].stats()[0]['failures'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()